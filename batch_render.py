@@ -0,0 +1,77 @@
+from concurrent.futures import ProcessPoolExecutor
+import html
+import os
+
+from defaults import IMAGE_FORMATS
+
+
+INDEX_NAME = 'index.html'
+
+
+def use_headless_backend():
+    """
+    Switches matplotlib to the non-interactive Agg backend; also the initializer of every render worker.
+    """
+    import matplotlib
+
+    matplotlib.use('Agg', force=True)
+
+
+def save_figure(fig, path):
+    """
+    Saves a figure and closes it right away so long batches keep memory flat.
+    """
+    import matplotlib.pyplot as plt
+
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def render_in_pool(render_function, tasks, workers=None):
+    """
+    Runs render_function(*task) for every task in a process pool using the Agg backend.
+
+    Returns one result per task, in task order; a failed task yields a dict with an 'error' key.
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=use_headless_backend) as executor:
+        futures = [executor.submit(render_function, *task) for task in tasks]
+        for task, future in zip(tasks, futures):
+            try:
+                results.append(future.result())
+            except Exception as error:
+                print(f"Failed to render {task[0]}: {error}")
+                results.append({'error': str(error), 'source': task[0]})
+    return results
+
+
+def write_index(output_dir, entries, title):
+    """
+    Writes an index.html in output_dir that links every rendered image.
+
+    Args:
+        entries (list): dicts with an 'image' file name relative to output_dir and a 'caption'.
+    """
+    items = []
+    for entry in entries:
+        image = html.escape(entry['image'])
+        caption = html.escape(entry.get('caption', entry['image']))
+        # Browsers cannot show PDFs inline in an <img>, so those are linked only
+        preview = '' if image.endswith('.pdf') else f'<a href="{image}"><img src="{image}" alt="{caption}" width="100%"></a>'
+        items.append(f'<figure>{preview}<figcaption><a href="{image}">{caption}</a></figcaption></figure>')
+
+    page = '\n'.join([
+        '<!DOCTYPE html>',
+        f'<html><head><meta charset="utf-8"><title>{html.escape(title)}</title></head><body>',
+        f'<h1>{html.escape(title)}</h1>',
+        *items,
+        '</body></html>',
+        '',
+    ])
+
+    index_path = os.path.join(output_dir, INDEX_NAME)
+    with open(index_path, 'w') as index_file:
+        index_file.write(page)
+    print(f"\n This file is saved: {index_path}\n")
+    return index_path
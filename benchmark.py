@@ -0,0 +1,305 @@
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from consecutivedays_analyzer import calculate_profits, find_consecutive_days, get_latest_currency_pairs
+from data_manifest import describe_data_file, save_manifest
+from defaults import BENCH_STAGES, DEFAULT_THRESHOLD
+from market_panel import load_panel, normalize_panel, panel_growth_rates
+from parallel_plotter import leadership_timeline
+from profiling import load_json_file, save_json_file
+from storage import DEFAULT_FORMAT, FILENAME_TIME_FORMAT, format_epoch, ohlcv_filename, read_ohlcv, write_ohlcv
+
+
+
+
+
+
+# Synthetic candles start here, so every row count fits in the datetime range pandas can write
+SYNTHETIC_START = 1420070400  # 2015-01-01 00:00 UTC
+
+# Written next to data/ so an existing synthetic tree can be reused when its config matches
+SYNTHETIC_CONFIG_NAME = 'synthetic.json'
+
+# Stages faster than this are too noisy to flag as regressions
+MIN_REGRESSION_SECONDS = 0.01
+
+
+def synthetic_pair_names(num_pairs):
+  return [f'SYN{i:04d}-USD' for i in range(num_pairs)]
+
+
+def synthetic_ohlcv(num_rows, interval, seed=0, pair_index=0):
+  """
+  Deterministic random-walk candles for one synthetic pair.
+
+  The same (seed, pair_index) always gives the same frame, so timings from
+  different runs are measured on identical data.
+  """
+  rng = np.random.default_rng([seed, pair_index])
+  close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.03, num_rows)))
+  open_prices = np.concatenate(([100.0], close[:-1]))
+  wick = np.abs(rng.normal(0, 0.01, (2, num_rows)))
+
+  return pd.DataFrame({
+    'time': pd.to_datetime(SYNTHETIC_START + np.arange(num_rows, dtype=np.int64) * interval, unit='s'),
+    'low': np.minimum(open_prices, close) * (1 - wick[0]),
+    'high': np.maximum(open_prices, close) * (1 + wick[1]),
+    'open': open_prices,
+    'close': close,
+    'volume': np.exp(rng.normal(10, 1, num_rows)),
+  })
+
+
+def generate_synthetic_data(root, num_pairs, num_rows, interval=86400, fmt=DEFAULT_FORMAT, seed=0):
+  """
+  Writes num_pairs synthetic pairs of num_rows candles into root/data/{interval}/, manifest included.
+
+  An existing tree generated with the same settings is reused as is.
+
+  Returns the time spent generating, 0 when the tree was reused.
+  """
+  if num_pairs < 1 or num_rows < 2:
+    raise ValueError("A synthetic dataset needs at least 1 pair and 2 rows")
+  last_time = SYNTHETIC_START + (num_rows - 1) * interval
+  if last_time > pd.Timestamp.max.timestamp():
+    raise ValueError(f"{num_rows} rows of {interval}s candles run past the year 2262; use a shorter interval")
+
+  config = {'pairs': num_pairs, 'rows': num_rows, 'interval': interval, 'format': fmt, 'seed': seed}
+  base_path = f'{root}/data/{interval}'
+  config_path = os.path.join(root, SYNTHETIC_CONFIG_NAME)
+  try:
+    with open(config_path) as config_file:
+      if json.load(config_file) == config:
+        return 0.0
+  except (OSError, ValueError):
+    pass
+
+  started = time.perf_counter()
+  shutil.rmtree(base_path, ignore_errors=True)
+  os.makedirs(base_path)
+
+  times = SYNTHETIC_START + np.arange(num_rows, dtype=np.int64) * interval
+  manifest = {'pairs': {}}
+  for pair_index, currency_pair in enumerate(synthetic_pair_names(num_pairs)):
+    df = synthetic_ohlcv(num_rows, interval, seed, pair_index)
+    filename = f"{base_path}/{ohlcv_filename(currency_pair, interval, df['time'].iloc[-1], fmt)}"
+    write_ohlcv(df, filename)
+    manifest['pairs'][currency_pair] = describe_data_file(filename, times)
+  save_manifest(base_path, manifest)
+
+  with open(config_path, 'w') as config_file:
+    json.dump(config, config_file)
+  return time.perf_counter() - started
+
+
+def _bench_context(root, num_pairs, num_rows, interval, price_tolerance, volume_tolerance, num_consecutive_days):
+  """
+  Inputs shared by the stages: resolved files, loaded frames and their positions, and the plotter's panel.
+  """
+  with contextlib.redirect_stdout(io.StringIO()):
+    files = get_latest_currency_pairs(synthetic_pair_names(num_pairs), interval, root)
+  frames = [read_ohlcv(file) for file in files]
+  start_date = format_epoch(SYNTHETIC_START, FILENAME_TIME_FORMAT)
+  end_date = format_epoch(SYNTHETIC_START + (num_rows - 1) * interval, FILENAME_TIME_FORMAT)
+  return {
+    'root': root,
+    'pairs': synthetic_pair_names(num_pairs),
+    'interval': interval,
+    'files': files,
+    'frames': frames,
+    'positions': [find_consecutive_days(df, price_tolerance, volume_tolerance, num_consecutive_days) for df in frames],
+    'tolerances': (price_tolerance, volume_tolerance, num_consecutive_days),
+    'start_date': start_date,
+    'end_date': end_date,
+    'panel': load_panel(files, start_date, end_date, interval),
+  }
+
+
+def _plot_load(context):
+  # The parallel_plotter path up to drawing: panel, normalization and leader timeline
+  panel = load_panel(context['files'], context['start_date'], context['end_date'], context['interval'])
+  normalize_panel(panel['close'], True, True)
+  leadership_timeline(panel.frame(panel_growth_rates(panel)), context['interval'])
+
+
+def _startup(module):
+  script_directory = os.path.dirname(os.path.abspath(__file__))
+  return lambda context: subprocess.run([sys.executable, '-c', f'import main, {module}'], cwd=script_directory, check=True)
+
+
+# Each stage runs over every pair; the printing ones are silenced while they are timed
+STAGE_FUNCTIONS = {
+  'startup_fetch': _startup('fetch_download_currencies'),
+  'startup_analyze': _startup('consecutivedays_analyzer'),
+  'resolve': lambda context: get_latest_currency_pairs(context['pairs'], context['interval'], context['root']),
+  'read': lambda context: [read_ohlcv(file) for file in context['files']],
+  'find_consecutive_days': lambda context: [find_consecutive_days(df, *context['tolerances']) for df in context['frames']],
+  'calculate_profits': lambda context: [calculate_profits(df, positions) for df, positions in zip(context['frames'], context['positions'])],
+  'normalize_panel': lambda context: normalize_panel(context['panel']['close'], True, True),
+  'plot_load': _plot_load,
+}
+
+
+def time_stage(stage, context, repeat=3):
+  """
+  Returns (best seconds over repeat runs, peak traced memory in MB of one more run).
+
+  Memory is traced in a separate run so tracemalloc does not slow the timed ones.
+  """
+  function = STAGE_FUNCTIONS[stage]
+  best = np.inf
+  with contextlib.redirect_stdout(io.StringIO()):
+    for _ in range(max(1, repeat)):
+      started = time.perf_counter()
+      function(context)
+      best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+      function(context)
+      peak = tracemalloc.get_traced_memory()[1]
+    finally:
+      tracemalloc.stop()
+  return best, peak / 2**20
+
+
+def config_key(config):
+  """
+  Baseline key of a run: the synthetic dataset plus the analysis parameters, which change the timed work.
+  """
+  key = f"{config['format']}-{config['interval']}-{config['pairs']}x{config['rows']}-seed{config['seed']}"
+  return f"{key}-p{config['price_tolerance']}-v{config['volume_tolerance']}-n{config['num_consecutive_days']}"
+
+
+def _git_commit():
+  try:
+    return subprocess.run(
+      ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+      capture_output=True, text=True, timeout=10,
+    ).stdout.strip() or None
+  except (OSError, subprocess.SubprocessError):
+    return None
+
+
+def find_regressions(run, baseline, threshold=DEFAULT_THRESHOLD):
+  """
+  Compares a run with the baseline run of the same config.
+
+  A stage regresses when its time or peak memory grew by more than threshold
+  (0.25 = 25%); times under MIN_REGRESSION_SECONDS are ignored as noise.
+  Returns a list of messages, empty when nothing regressed.
+  """
+  regressions = []
+  for stage, result in run['stages'].items():
+    reference = baseline['stages'].get(stage)
+    if reference is None:
+      continue
+    if result['seconds'] > reference['seconds'] * (1 + threshold) and result['seconds'] - reference['seconds'] > MIN_REGRESSION_SECONDS:
+      regressions.append(f"{stage}: {result['seconds']:.4f}s vs baseline {reference['seconds']:.4f}s (+{(result['seconds'] / reference['seconds'] - 1) * 100:.0f}%)")
+    if reference['peak_mb'] > 0 and result['peak_mb'] > reference['peak_mb'] * (1 + threshold):
+      regressions.append(f"{stage}: peak {result['peak_mb']:.1f}MB vs baseline {reference['peak_mb']:.1f}MB (+{(result['peak_mb'] / reference['peak_mb'] - 1) * 100:.0f}%)")
+  return regressions
+
+
+def benchmark(
+    num_pairs = 10,
+    num_rows = 10000,
+    interval = 86400,
+    fmt = DEFAULT_FORMAT,
+    seed = 0,
+    stages = None,
+    repeat = 3,
+    price_tolerance = 0.01,
+    volume_tolerance = 0.1,
+    num_consecutive_days = 3,
+    data_dir = None,
+    history = None,
+    baseline = None,
+    save_baseline = False,
+    threshold = DEFAULT_THRESHOLD,
+):
+  """
+  Times every stage on a synthetic dataset, fully offline.
+
+  The run (timings, rows per second and peak memory per stage) is appended to
+  the history file. With save_baseline it becomes the baseline for its config;
+  otherwise it is compared with the stored baseline of the same config.
+
+  Args:
+      data_dir (str): where the synthetic data/{interval}/ tree is kept and reused; a temporary directory when None.
+
+  Returns the list of regression messages, empty when nothing regressed.
+  """
+  script_directory = os.path.dirname(os.path.abspath(__file__))
+  history = history or f'{script_directory}/bench/history.json'
+  baseline = baseline or f'{script_directory}/bench/baseline.json'
+  stages = stages or BENCH_STAGES
+
+  root = data_dir or tempfile.mkdtemp(prefix='bench_')
+  try:
+    config = {
+      'pairs': num_pairs, 'rows': num_rows, 'interval': interval, 'format': fmt, 'seed': seed,
+      'price_tolerance': price_tolerance, 'volume_tolerance': volume_tolerance, 'num_consecutive_days': num_consecutive_days,
+    }
+    print(f"Generating {num_pairs} synthetic pairs of {num_rows} rows in {root}")
+    generate_seconds = generate_synthetic_data(root, num_pairs, num_rows, interval, fmt, seed)
+
+    context = _bench_context(root, num_pairs, num_rows, interval, price_tolerance, volume_tolerance, num_consecutive_days)
+    run = {
+      'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+      'commit': _git_commit(),
+      'config': config,
+      'key': config_key(config),
+      'parameters': {'price_tolerance': price_tolerance, 'volume_tolerance': volume_tolerance, 'num_consecutive_days': num_consecutive_days, 'repeat': repeat},
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'pandas': pd.__version__,
+      'generate_seconds': generate_seconds,
+      'stages': {},
+    }
+
+    print(f"\n{'stage':<24}{'seconds':>12}{'rows/s':>16}{'peak MB':>12}")
+    for stage in stages:
+      seconds, peak_mb = time_stage(stage, context, repeat)
+      units = 1 if stage.startswith('startup') else num_pairs if stage == 'resolve' else num_pairs * num_rows
+      run['stages'][stage] = {'seconds': seconds, 'throughput': units / seconds if seconds else None, 'peak_mb': peak_mb}
+      print(f"{stage:<24}{seconds:>12.4f}{units / seconds if seconds else np.inf:>16.4g}{peak_mb:>12.1f}")
+  finally:
+    if data_dir is None:
+      shutil.rmtree(root, ignore_errors=True)
+
+  runs = load_json_file(history, [])
+  runs.append(run)
+  save_json_file(history, runs)
+  print(f"\n This file is saved: {history}\n")
+
+  baselines = load_json_file(baseline, {})
+  if save_baseline:
+    baselines[run['key']] = run
+    save_json_file(baseline, baselines)
+    print(f"\n This file is saved: {baseline}\n")
+    return []
+
+  if run['key'] not in baselines:
+    print(f"No baseline for {run['key']} in {baseline}; run with --save-baseline to store one")
+    return []
+
+  regressions = find_regressions(run, baselines[run['key']], threshold)
+  for regression in regressions:
+    print(f"REGRESSION {regression}")
+  if not regressions:
+    print(f"No stage regressed more than {threshold * 100:.0f}% against the baseline from {baselines[run['key']]['time']}")
+  return regressions
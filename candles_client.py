@@ -0,0 +1,269 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import datetime
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from defaults import COINBASE_API_URL, DEFAULT_PAGE_WORKERS, DEFAULT_REQUESTS_PER_SECOND
+
+
+# The candles endpoint returns at most 300 candles per request
+MAX_CANDLES_PER_REQUEST = 300
+
+CANDLE_COLUMNS = ['time', 'low', 'high', 'open', 'close', 'volume']
+
+
+class CandlesRequestError(Exception):
+  """
+  Raised when the candles endpoint keeps failing or rejects a request.
+  """
+
+
+class TokenBucket:
+  """
+  Thread-safe token bucket shared by every worker that talks to the exchange.
+
+  The refill rate is lowered when the exchange answers 429/5xx (penalize) and
+  recovers gradually on successful requests (reward).
+  """
+  def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, capacity=None, min_rate=0.5):
+    self.max_rate = float(rate)
+    self.rate = float(rate)
+    self.min_rate = min(float(min_rate), self.max_rate)
+    self.capacity = float(capacity if capacity is not None else rate)
+    self.tokens = self.capacity
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+
+  def _refill(self):
+    now = time.monotonic()
+    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def acquire(self):
+    """
+    Blocks until a request may be sent.
+    """
+    while True:
+      with self.lock:
+        self._refill()
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        wait = (1 - self.tokens) / self.rate
+      time.sleep(wait)
+
+  def penalize(self):
+    with self.lock:
+      self._refill()
+      self.rate = max(self.min_rate, self.rate / 2)
+      self.tokens = min(self.tokens, 0)
+
+  def reward(self):
+    with self.lock:
+      if self.rate < self.max_rate:
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def _isoformat(moment):
+  return moment.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class CandlesClient:
+  """
+  Minimal client for the /products/{pair}/candles endpoint.
+
+  All requests go through one requests.Session and one TokenBucket, so a client
+  can be shared by every fetch thread. 429 and 5xx responses are retried with
+  exponential backoff (or the server's Retry-After) and slow the shared bucket down.
+
+  Ranges longer than one page are fetched page_workers pages at a time; the
+  session keeps up to pool_size keep-alive connections, so concurrent pages
+  reuse connections instead of opening new ones.
+  """
+  def __init__(self, api_url=COINBASE_API_URL, rate_limiter=None, session=None, max_retries=6, backoff=0.5, timeout=30, page_workers=1, pool_size=10):
+    self.api_url = api_url.rstrip('/')
+    self.rate_limiter = rate_limiter or TokenBucket()
+    if session is None:
+      session = requests.Session()
+      adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+      session.mount('http://', adapter)
+      session.mount('https://', adapter)
+    self.session = session
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.timeout = timeout
+    self.page_workers = max(1, page_workers)
+
+  def _retry_delay(self, response, attempt):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+      try:
+        return float(retry_after)
+      except ValueError:
+        pass
+    return self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+
+  def _get_json(self, url, params, label, max_retries=None):
+    """
+    GETs url through the rate limiter, retrying 429/5xx and connection errors, and returns the decoded JSON.
+    """
+    max_retries = self.max_retries if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+      self.rate_limiter.acquire()
+      response = None
+      try:
+        response = self.session.get(url, params=params, timeout=self.timeout)
+      except requests.RequestException as error:
+        reason = str(error)
+      else:
+        if response.status_code == 200:
+          self.rate_limiter.reward()
+          return response.json()
+        if response.status_code != 429 and response.status_code < 500:
+          raise CandlesRequestError(f"{label}: HTTP {response.status_code} {response.text[:200]}")
+        reason = f"HTTP {response.status_code}"
+        self.rate_limiter.penalize()
+
+      if attempt < max_retries:
+        time.sleep(self._retry_delay(response, attempt))
+
+    raise CandlesRequestError(f"{label}: giving up after {max_retries + 1} attempts ({reason})")
+
+  def get_candles(self, currency_pair, granularity, start, end):
+    """
+    Requests one page of candles between two datetimes and returns the raw rows.
+    """
+    url = f"{self.api_url}/products/{currency_pair}/candles"
+    params = {'start': _isoformat(start), 'end': _isoformat(end), 'granularity': granularity}
+    return self._get_json(url, params, currency_pair)
+
+  def get_products(self, max_retries=1):
+    """
+    Requests the exchange's product list: one dict per pair with at least 'id' and 'status'.
+
+    Retried only briefly by default, since callers fall back to the cached catalog.
+    """
+    return self._get_json(f"{self.api_url}/products", None, 'products', max_retries)
+
+  def page_windows(self, granularity, start, end):
+    """
+    Splits [start, end] into non-overlapping windows of at most MAX_CANDLES_PER_REQUEST candles.
+    """
+    step = datetime.timedelta(seconds=granularity * MAX_CANDLES_PER_REQUEST)
+    last_offset = datetime.timedelta(seconds=granularity * (MAX_CANDLES_PER_REQUEST - 1))
+
+    windows = []
+    window_start = start
+    while window_start <= end:
+      windows.append((window_start, min(window_start + last_offset, end)))
+      window_start += step
+    return windows
+
+  def _get_page(self, currency_pair, granularity, window):
+    """
+    Requests one window and returns its candles as a float64 array, without any from outside the window.
+    """
+    page = np.asarray(self.get_candles(currency_pair, granularity, *window), dtype=np.float64).reshape(-1, len(CANDLE_COLUMNS))
+    first, last = (moment.replace(tzinfo=datetime.timezone.utc).timestamp() for moment in window)
+    # A candle outside its window belongs to the neighbouring page, which requests it itself
+    return page[(page[:, 0] >= first) & (page[:, 0] <= last)]
+
+  def _get_spooled_page(self, currency_pair, granularity, window, spool):
+    page = spool.get(window)
+    if page is None:
+      page = self._get_page(currency_pair, granularity, window)
+      spool.put(window, page)
+    return page
+
+  def retrieve_data(self, currency_pair, granularity, start_date, end_date, spool=None, progress=None):
+    """
+    Retrieves candles between two 'YYYY-MM-DD-HH-MM' dates, page by page.
+
+    Pages are requested concurrently (page_workers at a time) and each one is
+    stored in its own slot as it arrives, so the order responses come back in
+    does not matter. The pages are checked with verify_pages() before they are
+    combined; a failed page fails the whole range, so no partial history is returned.
+
+    With a spool (see fetch_journal.PageSpool) ranges of several pages keep
+    every page on disk as it arrives and reuse the pages of an interrupted
+    run. progress(pages_done, pages) is called after every page.
+
+    Returns a DataFrame shaped like HistoricalData.retrieve_data(): indexed by
+    'time', sorted ascending, with low, high, open, close and volume columns.
+    """
+    start = datetime.datetime.strptime(start_date, '%Y-%m-%d-%H-%M')
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d-%H-%M')
+
+    windows = self.page_windows(granularity, start, end)
+    slots = [None] * len(windows)
+    get_page = self._get_page
+    if spool is not None and len(windows) > 1:
+      get_page = lambda *page_args: self._get_spooled_page(*page_args, spool)
+
+    if self.page_workers == 1 or len(windows) <= 1:
+      for i, window in enumerate(windows):
+        slots[i] = get_page(currency_pair, granularity, window)
+        if progress:
+          progress(i + 1, len(windows))
+    else:
+      with ThreadPoolExecutor(max_workers=min(self.page_workers, len(windows))) as executor:
+        futures = {executor.submit(get_page, currency_pair, granularity, window): i for i, window in enumerate(windows)}
+        try:
+          for pages_done, future in enumerate(as_completed(futures), 1):
+            slots[futures[future]] = future.result()
+            if progress:
+              progress(pages_done, len(windows))
+        except BaseException:
+          # Pages not started yet are dropped; the range is fetched again on the next run
+          for future in futures:
+            future.cancel()
+          raise
+
+    missing = verify_pages(currency_pair, slots, granularity)
+    if missing:
+      print(f"{currency_pair}: {missing} candles without trades between {start_date} and {end_date}")
+    rows = np.concatenate(slots) if slots else np.empty((0, len(CANDLE_COLUMNS)))
+    return candles_to_dataframe(rows, start, end)
+
+
+def candles_to_dataframe(rows, start=None, end=None):
+  """
+  Converts raw [time, low, high, open, close, volume] rows into a sorted, de-duplicated DataFrame.
+  """
+  data = pd.DataFrame(rows, columns=CANDLE_COLUMNS)
+  data['time'] = pd.to_datetime(data['time'].astype('int64'), unit='s')
+  if start is not None and end is not None:
+    data = data[data['time'].between(start, end)]
+  data = data.drop_duplicates(subset='time', keep='last').sort_values('time')
+  return data.set_index('time')[CANDLE_COLUMNS[1:]].astype('float64')
+
+
+def verify_pages(currency_pair, slots, granularity):
+  """
+  Checks the pages of one range before they are combined and saved.
+
+  Every page must have arrived, hold candles on the granularity grid in
+  strictly ascending order, and end before the next page starts, so the
+  combined range has no missing pages and no overlapping candles. Candles
+  the exchange has no trades for are simply absent; their count is returned.
+  """
+  missing_pages = [i for i, page in enumerate(slots) if page is None]
+  if missing_pages:
+    raise CandlesRequestError(f"{currency_pair}: {len(missing_pages)} of {len(slots)} pages missing")
+
+  times = np.concatenate([np.sort(page[:, 0]) for page in slots]) if slots else np.empty(0)
+  if np.any(times % granularity):
+    raise CandlesRequestError(f"{currency_pair}: candles off the {granularity}s grid")
+  if np.any(np.diff(times) <= 0):
+    raise CandlesRequestError(f"{currency_pair}: overlapping candles between pages")
+
+  if len(times) < 2:
+    return 0
+  return int((times[-1] - times[0]) // granularity + 1 - len(times))
@@ -1,8 +1,22 @@
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import datetime
 import os
 
+from batch_render import render_in_pool, save_figure, write_index
+from defaults import COINBASE_API_URL
+from profit_stats import compute_profit_stats
+from data_manifest import describe_data_file, load_manifest, resolve_latest_files
+from downsample import axes_pixel_width, bucket_envelope, downsample_series, minmax_indices
+from profiling import profile_stage, profiler
+from result_cache import DEFAULT_CACHE_MB, ResultCache, analysis_key
+from storage import DEFAULT_CHUNKSIZE, iter_ohlcv_chunks, parse_ohlcv_filename, read_ohlcv
+from signal_rules import RuleStreakDetector, compile_rule
+from streak_engine import StreakDetector, find_consecutive_positions, find_streak_positions
+
+
+# Close and volume extremes kept per chunk for the chart when analyzing in chunks
+CHART_BUCKETS_PER_CHUNK = 500
+
 
 
 
@@ -21,30 +35,9 @@ def get_latest_currency_pairs(currency_pairs, interval, abs_file_path):
       print(f"The base path {base_path} does not exist.")
       return path_file_names
 
-  # Iterate through each currency pair to find the latest file
-  for pair in currency_pairs:
-      # Initialize a flag to check if a matching file is found
-      found = False
-      # List all files in the base directory that matches the interval
-      files = [f for f in os.listdir(base_path) if os.path.isfile(os.path.join(base_path, f))]
-
-      # Filter and sort files by date for the current currency pair
-      sorted_files = sorted(
-          [file for file in files if file.startswith(pair + "_")],
-          key=lambda x: datetime.datetime.strptime(x.split('_')[-1], "%Y-%m-%d-%H-%M.csv"),
-          reverse=True
-      )
-
-
-      # If we find at least one file for the currency pair, add the full path of the latest file to the list
-      if sorted_files:
-          latest_file = sorted_files[0]
-          full_path = os.path.join(base_path, latest_file)
-          path_file_names.append(full_path)
-          found = True
-
-      if not found:
-          print(f"No files found for {pair} in {base_path}")
+  # Resolve the latest file of every pair through the data manifest instead of scanning the directory
+  with profile_stage('resolve'):
+    path_file_names = resolve_latest_files(currency_pairs, base_path)
 
   return path_file_names
 
@@ -82,70 +75,340 @@ def is_higher_close_and_volume(price_data, i, price_tolerance, volume_tolerance)
 
 
 
-def find_consecutive_days(df, price_tolerance, volume_tolerance, num_consecutive_days=3):
-  price_data = pd.DataFrame({
-    'price': df[['open', 'close']].max(axis=1),
-    'volume': df['volume']
-  })
+def find_consecutive_days(df, price_tolerance, volume_tolerance, num_consecutive_days=3, rule=None):
+  # With a rule (see signal_rules), its compiled mask replaces the close and volume comparison
+  if rule is not None:
+    rule = compile_rule(rule)
+    mask = rule.evaluate({column: df[column].to_numpy() for column in rule.columns}, price_tolerance, volume_tolerance)
+    return find_streak_positions(mask, num_consecutive_days)
 
-  consecutive_days = []
-  consecutive_days_counter = 1
-  position = []
+  # Vectorized equivalent of calling is_higher_close_and_volume for every row;
+  # returns the same [start, end, counter] positions as the original loop
+  return find_consecutive_positions(
+    df['open'].to_numpy(),
+    df['close'].to_numpy(),
+    df['volume'].to_numpy(),
+    price_tolerance,
+    volume_tolerance,
+    num_consecutive_days,
+  )
 
-  for i in range(1, len(df)):
-    if is_higher_close_and_volume(price_data, i, price_tolerance, volume_tolerance):
-      consecutive_days_counter += 1
-    else:
-      consecutive_days_counter = 0
 
+def analyze_in_chunks(
+    selected_file,
+    price_tolerance,
+    volume_tolerance,
+    num_consecutive_days = 3,
+    start_from = 0,
+    remove_lastdatapoints = 0,
+    chunksize = DEFAULT_CHUNKSIZE,
+    rule = None,
+):
+  """
+  Streams a data file through a StreakDetector (or a RuleStreakDetector for a rule) instead of loading the whole history.
+
+  Returns (df_dates, consecutive_days, stats) like the in-memory path, except that
+  df_dates only keeps the rows the chart needs (the close and volume extremes of every
+  chunk plus every entry and exit) and consecutive_days indexes into those rows.
+  """
+  stop_row = None
+  if remove_lastdatapoints:
+    # Row count comes from the manifest, so the file is not read twice; files the
+    # manifest does not describe (no entry, no row count, an older file) are counted once
+    base_path = os.path.dirname(selected_file.rstrip('/'))
+    entry = load_manifest(base_path)['pairs'].get(parse_ohlcv_filename(selected_file)[0])
+    if entry is None or entry.get('rows') is None or entry.get('file') != os.path.basename(selected_file.rstrip('/')):
+      entry = describe_data_file(selected_file)
+    stop_row = entry['rows'] - remove_lastdatapoints
+
+  currency_pair = parse_ohlcv_filename(selected_file)[0]
+  if rule is not None:
+    detector = RuleStreakDetector(compile_rule(rule), price_tolerance, volume_tolerance, num_consecutive_days)
+  else:
+    detector = StreakDetector(price_tolerance, volume_tolerance, num_consecutive_days)
+  entries, exits = [], []
+  kept = {'position': [], 'time': [], 'close': [], 'volume': []}
+  analysed_rows = 0
+
+  columns = ['time', 'close', 'volume'] + [column for column in detector.columns if column not in ('close', 'volume')]
+  chunks = iter_ohlcv_chunks(selected_file, columns, chunksize, start_row=start_from)
+  for first_row, chunk in profiler.timed_iter(chunks, 'load', currency_pair):
+    position = first_row - start_from
+    num_rows = len(chunk['close'])
+
+    # Rows past stop_row are only drawn, not analysed
+    fed = num_rows if stop_row is None else max(0, min(num_rows, stop_row - first_row))
+    with profile_stage('detect', currency_pair):
+      chunk_entries, chunk_exits = detector.feed_columns({column: chunk[column][:fed] for column in detector.columns})
+    entries.append(chunk_entries)
+    exits.append(chunk_exits)
+    analysed_rows += fed
+
+    open_entry = [] if detector.entry is None else [detector.entry]
+    rows = np.concatenate((
+      minmax_indices(chunk['close'], CHART_BUCKETS_PER_CHUNK),
+      minmax_indices(chunk['volume'], CHART_BUCKETS_PER_CHUNK),
+      chunk_entries - position,
+      chunk_exits - position,
+      np.asarray(open_entry, dtype=np.int64) - position,
+    )).astype(np.int64)
+    rows = np.unique(rows[(rows >= 0) & (rows < num_rows)])
+
+    kept['position'].append(rows + position)
+    for column in ['time', 'close', 'volume']:
+      kept[column].append(np.asarray(chunk[column][rows]))
+
+  kept = {column: np.concatenate(values) if values else np.empty(0) for column, values in kept.items()}
+  df_dates = pd.DataFrame(
+    {'close': kept['close'], 'volume': kept['volume']},
+    index=pd.DatetimeIndex(pd.to_datetime(kept['time'].astype(np.int64), unit='s'), name='time'),
+  )
+
+  # Map positions from file rows to the kept rows; every entry and exit row was kept
+  entries = np.concatenate(entries) if entries else np.empty(0, dtype=np.int64)
+  exits = np.concatenate(exits) if exits else np.empty(0, dtype=np.int64)
+  kept_positions = kept['position'].astype(np.int64)
+  consecutive_days = [
+    [int(start), int(end), 0]
+    for start, end in zip(np.searchsorted(kept_positions, entries), np.searchsorted(kept_positions, exits))
+  ]
+
+  with profile_stage('profit', currency_pair):
+    stats = compute_profit_stats(kept['close'], consecutive_days, analysed_rows)
+  return df_dates, consecutive_days, stats
+
+
+
+
+
+
+def analyze_file(
+    selected_file,
+    price_tolerance,
+    volume_tolerance,
+    num_consecutive_days = 3,
+    start_from = 0,
+    remove_lastdatapoints = 0,
+    chunksize = None,
+    cache = None,
+    rule = None,
+):
+  """
+  Analyzes one data file and returns (df_dates, consecutive_days, stats).
+
+  With a ResultCache, a result computed earlier for the same data and parameters
+  is returned without reading the data file. rule is the text of a signal rule
+  replacing the close and volume comparison.
+  """
+  currency_pair = parse_ohlcv_filename(selected_file)[0]
+  if cache is not None:
+    with profile_stage('cache', currency_pair):
+      # Without a rule the key stays the same as before rules existed
+      parameters = (price_tolerance, volume_tolerance, num_consecutive_days, start_from, remove_lastdatapoints, chunksize)
+      key = analysis_key(selected_file, parameters + ((rule,) if rule is not None else ()))
+      result = cache.get(selected_file, key)
+    if result is not None:
+      return result
+
+  if chunksize:
+    # Stream the file so memory is bounded by chunksize instead of the history length
+    result = analyze_in_chunks(
+      selected_file, price_tolerance, volume_tolerance, num_consecutive_days, start_from, remove_lastdatapoints, chunksize, rule,
+    )
+  else:
+    # Read data into DataFrame
+    with profile_stage('load', currency_pair):
+      data = read_ohlcv(selected_file)
+    with profile_stage('filter', currency_pair):
+      df = data[start_from:len(data)-remove_lastdatapoints]
 
-    # print(f'{consecutive_days_counter} - {len(position)}; {consecutive_days_counter == 0 and len(position) >= 1}')
+    # Find consecutive days
+    with profile_stage('detect', currency_pair):
+      consecutive_days = find_consecutive_days(df, price_tolerance, volume_tolerance, num_consecutive_days, rule)
+    with profile_stage('profit', currency_pair):
+      stats = compute_profit_stats(df['close'].to_numpy(), consecutive_days, len(df))
+    result = data.set_index('time')[start_from:][['close', 'volume']], consecutive_days, stats
 
-    if consecutive_days_counter == num_consecutive_days:
-      position.append(i)
-    elif consecutive_days_counter == 0 and len(position) >= 1:
-      position.append(i)
-      position.append(consecutive_days_counter)
+  if cache is not None:
+    with profile_stage('cache', currency_pair):
+      cache.put(selected_file, key, *result)
+  return result
 
-      consecutive_days.append(position.copy())
-      consecutive_days_counter = 0
-      position = []
 
-  return consecutive_days
+def calculate_profits(df, consecutive_days, investment_amount = 100):
+  stats = compute_profit_stats(df['close'].to_numpy(), consecutive_days, len(df), investment_amount)
+  print_profit_stats(stats)
+  return stats
 
 
+def print_profit_stats(stats):
+  for balance in stats['balances']:
+    print('Balance: ', balance)
 
+  # Display individual and total profits
+  for i, profit in enumerate(stats['profits'], start=1):
+    print(f"Profit for position {i}: {profit:.2f}%")
 
+  print(f"Total cumulative percentage profit from all positions: {stats['total_return']:.2f}%")
+  print(f"Average return per year: {stats['average_yearly_return']:.2f}%")
+  print(f"CAGR: {stats['cagr']:.2f}%")
+  print(f"Total years: {stats['years']:.2f}")
 
 
-def calculate_profits(df, consecutive_days, investment_amount = 100):
-  balance = investment_amount
-  profits = []
 
-  # Calculate profit for each position
+
+
+
+
+def plot_consecutive_days(df_dates, consecutive_days, title, downsample=True):
+  """
+  Draws the close price, the volume and the entry/exit markers of every position and returns the figure.
+
+  With downsample the close line is reduced to about the axes' pixel width with LTTB,
+  the volume is drawn as one stepped fill of per-bucket maxima instead of one bar per
+  candle and the position markers are drawn as two line collections.
+  """
+  # for simpler visualisation
+  # df['close'] = np.log(df['close'])
+
+  # Plotting libraries are only loaded once there is something to draw
+  import matplotlib.pyplot as plt
+
+  # Create a figure and a set of subplots
+  fig, ax1 = plt.subplots(figsize=(14, 7))
+
+  # Plot the close chart on the primary y-axis
+  color = 'tab:blue'
+  ax1.set_xlabel('Date')
+  # ax1.set_xlabel('Date (index)')
+  ax1.set_ylabel('Close Price', color=color)
+  if downsample:
+    close_x, close_y = downsample_series(df_dates.index.to_numpy(), df_dates['close'].to_numpy(), axes_pixel_width(ax1))
+  else:
+    close_x, close_y = df_dates.index, df_dates['close']
+  ax1.plot(close_x, close_y, label='Close Price', color=color)
+  ax1.tick_params(axis='y', labelcolor=color)
+
+  # Rotate date labels for better readability
+  plt.xticks(rotation=45)
+
+  # Create a secondary y-axis for the volume bar chart
+  ax2 = ax1.twinx()
+  color = 'tab:gray'
+  ax2.set_ylabel('Volume', color=color)
+  if downsample:
+    volume_x, volume_y = bucket_envelope(df_dates.index.to_numpy(), df_dates['volume'].to_numpy(), axes_pixel_width(ax2))
+    ax2.fill_between(volume_x, volume_y, step='post', alpha=0.3, color=color)
+  else:
+    ax2.bar(df_dates.index, df_dates['volume'], alpha=0.3, color=color)
+  ax2.tick_params(axis='y', labelcolor=color)
+
+  # Mark consecutive days with vertical lines; one collection per color when downsampling
+  if downsample and len(consecutive_days):
+    positions = np.asarray(consecutive_days)
+    ax1.vlines(df_dates.index[positions[:, 0]], 0, 1, transform=ax1.get_xaxis_transform(), color='green', linestyle='-')
+    ax1.vlines(df_dates.index[positions[:, 1]], 0, 1, transform=ax1.get_xaxis_transform(), color='red', linestyle='-')
+    consecutive_days = []
+
   for start, end, consecutive_days_value in consecutive_days:
-    entry_price = df.iloc[start]['close']
-    exit_price = df.iloc[end]['close']
+    # Convert index positions to dates
+    start_date = df_dates.iloc[start].name
+    end_date = df_dates.iloc[end].name
 
+    # Use the dates for axvline
+    ax1.axvline(x=start_date, color='green', linestyle='-')
+    ax1.axvline(x=end_date, color='red', linestyle='-')
 
-    # Calculate profit in percent
-    profit_percent = (exit_price - entry_price) / entry_price
 
-    # Store profit for each position
-    profits.append(profit_percent * 100)
 
-    # Update total balance
-    balance = (1 + profit_percent) * balance
-    print('Balance: ', balance)
+  plt.title(title)
+  fig.tight_layout()  # For better layout handling
+  plt.legend(['Close Price'], loc='upper left')
+  return fig
 
-  # Display individual and total profits
-  for i, profit in enumerate(profits, start=1):
-    print(f"Profit for position {i}: {profit:.2f}%")
 
-  print(f"Total cumulative percentage profit from all positions: {(balance - investment_amount):.2f}%")
-  print(f"Average return per year: {(balance - investment_amount)/(len(df)/365):.2f}%")
-  print(f"CAGR: {(((balance/investment_amount)**(1/(len(df)/365))-1)*100):.2f}%")
-  print(f"Total years: {(len(df)/365):.2f}")
+def render_analysis_chart(
+    selected_file,
+    output_path,
+    price_tolerance,
+    volume_tolerance,
+    num_consecutive_days = 3,
+    start_from = 0,
+    remove_lastdatapoints = 0,
+    downsample = True,
+    chunksize = None,
+    cache = None,
+    rule = None,
+):
+  """
+  Analyzes one data file and saves its chart to output_path instead of showing it.
+
+  Runs inside the batch render pool; returns a summary for the index page.
+  """
+  df_dates, consecutive_days, stats = analyze_file(
+    selected_file, price_tolerance, volume_tolerance, num_consecutive_days, start_from, remove_lastdatapoints, chunksize, cache, rule,
+  )
+
+  fig = plot_consecutive_days(df_dates, consecutive_days, f'Close Price and Volume Chart - {selected_file}', downsample)
+  save_figure(fig, output_path)
+
+  return {
+    'source': selected_file,
+    'image': os.path.basename(output_path),
+    'trades': stats['trades'],
+    'cagr': stats['cagr'],
+    'total_return': stats['total_return'],
+  }
+
+
+
+
+
+
+
+def render_analysis_charts(
+    latest_selected_files,
+    output_dir,
+    price_tolerance,
+    volume_tolerance,
+    num_consecutive_days = 3,
+    start_from = 0,
+    remove_lastdatapoints = 0,
+    image_format = 'png',
+    workers = None,
+    downsample = True,
+    chunksize = None,
+    cache = None,
+    rule = None,
+):
+  """
+  Renders the chart of every data file into output_dir in a process pool and writes an index page.
+  """
+  os.makedirs(output_dir, exist_ok=True)
+
+  tasks = []
+  for selected_file in latest_selected_files:
+    currency_pair, interval = parse_ohlcv_filename(selected_file)[:2]
+    output_path = os.path.join(output_dir, f'{currency_pair}_{interval}.{image_format}')
+    tasks.append((selected_file, output_path, price_tolerance, volume_tolerance, num_consecutive_days, start_from, remove_lastdatapoints, downsample, chunksize, cache, rule))
+
+  results = render_in_pool(render_analysis_chart, tasks, workers)
+
+  entries = []
+  for result in results:
+    if 'error' in result:
+      continue
+    print(f"{result['image']}: {result['trades']} positions, total return {result['total_return']:.2f}%, CAGR {result['cagr']:.2f}%")
+    entries.append({
+      'image': result['image'],
+      'caption': f"{result['image']} - {result['trades']} positions, total return {result['total_return']:.2f}%, CAGR {result['cagr']:.2f}%",
+    })
+
+  title = f'Consecutive days analysis (p={price_tolerance}, v={volume_tolerance}, n={num_consecutive_days})'
+  if rule is not None:
+    title += f' - rule: {rule}'
+  write_index(output_dir, entries, title)
+  return results
 
 
 
@@ -161,6 +424,18 @@ def consecutivedays_analyzer(
     interval = 86400,
     start_from = 0,
     remove_lastdatapoints = 0,
+    output_dir = None,
+    image_format = 'png',
+    workers = None,
+    downsample = True,
+    chunksize = None,
+    follow = False,
+    replay = False,
+    poll_seconds = 60,
+    api_url = COINBASE_API_URL,
+    use_cache = True,
+    cache_mb = DEFAULT_CACHE_MB,
+    rule = None,
 ):
   script_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -189,67 +464,77 @@ def consecutivedays_analyzer(
   #TODO: Treat the amount of sigmals as a buy signal?
 
 
-  latest_selected_files = get_latest_currency_pairs(currency_pairs, interval, script_directory)
-
-
-
-  for selected_file in latest_selected_files:
-    # Read data into DataFrame
-    df = pd.read_csv(selected_file)
-    df = df[start_from:len(df)-remove_lastdatapoints]
-    print(len(df))
-    print(df['time'])
-
-    # Find consecutive days
-    consecutive_days = find_consecutive_days(df, price_tolerance, volume_tolerance, num_consecutive_days)
-    calculate_profits(df, consecutive_days)
-    # exit()
-
+  # Without an explicit list, analyze every pair in the data directory
+  if not currency_pairs:
+    with profile_stage('discovery'):
+      currency_pairs = list(load_manifest(f'{script_directory}/data/{interval}/')['pairs'])
 
+  latest_selected_files = get_latest_currency_pairs(currency_pairs, interval, script_directory)
 
-    # for simpler visualisation
-    # df['close'] = np.log(df['close'])
-
-    # Create a figure and a set of subplots
-    fig, ax1 = plt.subplots(figsize=(14, 7))
-
-
-
-    df_dates = pd.read_csv(selected_file, parse_dates=['time'], index_col='time')[start_from:]
-
-    # Plot the close chart on the primary y-axis
-    color = 'tab:blue'
-    ax1.set_xlabel('Date')
-    # ax1.set_xlabel('Date (index)')
-    ax1.set_ylabel('Close Price', color=color)
-    ax1.plot(df_dates.index, df_dates['close'], label='Close Price', color=color)
-    ax1.tick_params(axis='y', labelcolor=color)
-
-    # Rotate date labels for better readability
-    plt.xticks(rotation=45)
-
-    # Create a secondary y-axis for the volume bar chart
-    ax2 = ax1.twinx()
-    color = 'tab:gray'
-    ax2.set_ylabel('Volume', color=color)
-    ax2.bar(df_dates.index, df_dates['volume'], alpha=0.3, color=color)
-    ax2.tick_params(axis='y', labelcolor=color)
 
-    # Mark consecutive days with vertical lines
-    for start, end, consecutive_days_value in consecutive_days:
-      # Convert index positions to dates
-      start_date = df_dates.iloc[start].name
-      end_date = df_dates.iloc[end].name
+  if rule is not None:
+    # Checked before any file is read, so a typo fails fast
+    compile_rule(rule)
+
+  if follow or replay:
+    if rule is not None:
+      raise ValueError("--rule is not supported with --follow or --replay")
+    # Live mode: one small state per pair, updated candle by candle
+    from live_signals import follow_signals
+
+    follow_signals(
+      latest_selected_files,
+      price_tolerance,
+      volume_tolerance,
+      num_consecutive_days = num_consecutive_days,
+      interval = interval,
+      start_from = start_from,
+      replay = replay,
+      poll_seconds = poll_seconds,
+      api_url = api_url,
+      workers = workers or 4,
+    )
+    return
+
+
+
+  # Positions and statistics of unchanged files and parameters come from disk instead of being recomputed
+  cache = ResultCache(max_mb=cache_mb) if use_cache else None
+
+  if output_dir:
+    # The workers' own stages stay in their processes; the pool is timed as a whole
+    with profile_stage('render'):
+      render_analysis_charts(
+        latest_selected_files,
+        output_dir,
+        price_tolerance,
+        volume_tolerance,
+        num_consecutive_days = num_consecutive_days,
+        start_from = start_from,
+        remove_lastdatapoints = remove_lastdatapoints,
+        image_format = image_format,
+        workers = workers,
+        downsample = downsample,
+        chunksize = chunksize,
+        cache = cache,
+        rule = rule,
+      )
+    return
 
-      # Use the dates for axvline
-      ax1.axvline(x=start_date, color='green', linestyle='-')
-      ax1.axvline(x=end_date, color='red', linestyle='-')
 
 
+  import matplotlib.pyplot as plt
 
-    plt.title(f'Close Price and Volume Chart - {selected_file}')
-    fig.tight_layout()  # For better layout handling
-    plt.legend(['Close Price'], loc='upper left')
+  for selected_file in latest_selected_files:
+    currency_pair = parse_ohlcv_filename(selected_file)[0]
+    df_dates, consecutive_days, stats = analyze_file(
+      selected_file, price_tolerance, volume_tolerance, num_consecutive_days, start_from, remove_lastdatapoints, chunksize, cache, rule,
+    )
+    print_profit_stats(stats)
+
+    # Only building the figure is timed; the window stays open as long as it is looked at
+    with profile_stage('render', currency_pair):
+      plot_consecutive_days(df_dates, consecutive_days, f'Close Price and Volume Chart - {selected_file}', downsample)
     plt.show()
 
 
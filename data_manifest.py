@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+from storage import list_data_files, read_ohlcv_arrays, read_partition_index, storage_format
+
+
+
+
+
+
+# Kept next to the data files in every data/{interval}/ directory
+MANIFEST_NAME = 'manifest.json'
+
+# Serializes read-modify-write cycles when several fetch threads record files at once
+_manifest_lock = threading.Lock()
+
+
+def manifest_path(base_path):
+  return os.path.join(base_path, MANIFEST_NAME)
+
+
+def describe_data_file(path, times=None):
+  """
+  Builds the manifest entry for one data file: its name, row count and first/last epoch time.
+  """
+  if times is None and storage_format(path) == 'parts':
+    # The partition index already holds the row count and time bounds
+    partitions = read_partition_index(path)['partitions']
+    return {
+      'file': os.path.basename(path.rstrip('/')),
+      'rows': sum(partition['rows'] for partition in partitions),
+      'first_time': partitions[0]['first_time'] if partitions else None,
+      'last_time': partitions[-1]['last_time'] if partitions else None,
+    }
+
+  if times is None:
+    times = read_ohlcv_arrays(path, columns=['time'])['time']
+
+  return {
+    'file': os.path.basename(path.rstrip('/')),
+    'rows': int(len(times)),
+    'first_time': int(times[0]) if len(times) else None,
+    'last_time': int(times[-1]) if len(times) else None,
+  }
+
+
+def save_manifest(base_path, manifest):
+  """
+  Writes the manifest atomically (temp file then rename) and bumps its version.
+  """
+  manifest['version'] = manifest.get('version', 0) + 1
+
+  tmp_path = f'{manifest_path(base_path)}.tmp'
+  with open(tmp_path, 'w') as manifest_file:
+    json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+  os.replace(tmp_path, manifest_path(base_path))
+
+
+def build_manifest(base_path):
+  """
+  Scans base_path once and records the latest data file of every currency pair.
+  """
+  latest = {}
+  for path, (currency_pair, interval, last_time, fmt) in list_data_files(base_path):
+    if currency_pair not in latest or last_time > latest[currency_pair][1]:
+      latest[currency_pair] = (path, last_time)
+
+  previous_version = 0
+  if os.path.exists(manifest_path(base_path)):
+    try:
+      with open(manifest_path(base_path)) as manifest_file:
+        previous_version = json.load(manifest_file).get('version', 0)
+    except ValueError:
+      pass
+
+  manifest = {
+    'version': previous_version,
+    'pairs': {currency_pair: describe_data_file(path) for currency_pair, (path, last_time) in sorted(latest.items())},
+  }
+  save_manifest(base_path, manifest)
+  return manifest
+
+
+def load_manifest(base_path):
+  """
+  Loads the manifest of base_path, building it from a directory scan if it is missing or unreadable.
+  """
+  try:
+    with open(manifest_path(base_path)) as manifest_file:
+      return json.load(manifest_file)
+  except (OSError, ValueError):
+    print(f"Building data manifest for {base_path}")
+    return build_manifest(base_path)
+
+
+def record_data_file(base_path, currency_pair, path, times=None, **extra):
+  """
+  Points the manifest entry of a currency pair at a freshly written data file.
+
+  Extra keyword arguments are stored in the entry as well (e.g. the base candle a resampled file was built up to).
+  """
+  with _manifest_lock:
+    manifest = load_manifest(base_path)
+    manifest['pairs'][currency_pair] = {**describe_data_file(path, times), **extra}
+    save_manifest(base_path, manifest)
+    return manifest
+
+
+def resolve_latest_files(currency_pairs, base_path):
+  """
+  Resolves the latest data file of each currency pair through the manifest.
+
+  The directory is rescanned at most once, when an entry is missing or points
+  at a file that no longer exists (e.g. files copied in by hand).
+  """
+  manifest = load_manifest(base_path)
+  rebuilt = False
+
+  path_file_names = []
+  for pair in currency_pairs:
+    entry = manifest['pairs'].get(pair)
+    if (entry is None or not os.path.exists(os.path.join(base_path, entry['file']))) and not rebuilt:
+      manifest = build_manifest(base_path)
+      rebuilt = True
+      entry = manifest['pairs'].get(pair)
+
+    if entry is None:
+      print(f"No files found for {pair} in {base_path}")
+      continue
+    path_file_names.append(os.path.join(base_path, entry['file']))
+
+  return path_file_names
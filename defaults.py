@@ -0,0 +1,42 @@
+# Option choices and defaults shared by the CLI and the subsystems that use them.
+# Standard library only: main.py builds its parsers from these without importing
+# any subsystem, and the subsystems re-export them under their usual names.
+
+
+# Public exchange endpoint; point api_url at a local stand-in for offline testing
+COINBASE_API_URL = 'https://api.exchange.coinbase.com'
+
+# Public endpoints allow roughly 10 requests per second per IP
+DEFAULT_REQUESTS_PER_SECOND = 10
+
+# Pages of one pair requested concurrently during a long backfill; the shared rate limit still applies
+DEFAULT_PAGE_WORKERS = 4
+
+# Storage formats by file extension: CSV files, directories holding one .npy file per column,
+# or directories of time partitions, each laid out like a column directory
+FORMAT_EXTENSIONS = {
+  'csv': '.csv',
+  'npcol': '.npcol',
+  'parts': '.parts',
+}
+DEFAULT_FORMAT = 'csv'
+
+# Rows per chunk for streaming reads of long (e.g. 1-minute) histories
+DEFAULT_CHUNKSIZE = 100000
+
+GAP_MODES = ['nan', 'ffill']
+
+# The exchange lists or delists pairs rarely; one product request a day is plenty
+DEFAULT_CATALOG_TTL_HOURS = 24
+
+IMAGE_FORMATS = ['png', 'svg', 'pdf']
+
+SCREEN_FORMATS = ['table', 'json']
+
+DEFAULT_CACHE_MB = 512
+
+# Stages in run order; each one times a single call path over every synthetic pair,
+# except the startup ones, which time a fresh interpreter importing a command's modules
+BENCH_STAGES = ['startup_fetch', 'startup_analyze', 'resolve', 'read', 'find_consecutive_days', 'calculate_profits', 'normalize_panel', 'plot_load']
+
+DEFAULT_THRESHOLD = 0.25
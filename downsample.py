@@ -0,0 +1,116 @@
+import numpy as np
+
+
+# Points kept per pixel of axes width when a series is downsampled
+POINTS_PER_PIXEL = 1
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def axes_pixel_width(ax):
+    """
+    Returns the width of an axes in display pixels, used as the downsampling target.
+    """
+    return max(3, int(ax.get_window_extent().width * POINTS_PER_PIXEL))
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: picks n_out indices that preserve the visual shape of y over x.
+
+    The first and last points are always kept; every bucket in between keeps the
+    point forming the largest triangle with the previously kept point and the
+    average of the next bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if end <= start:
+            end = start + 1
+
+        # The bucket after the last one is the final point
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+        average_x = x[next_start:next_end].mean()
+        average_y = np.nanmean(y[next_start:next_end]) if np.isfinite(y[next_start:next_end]).any() else y[previous]
+
+        areas = np.abs(
+            (x[previous] - average_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (average_y - y[previous])
+        )
+        areas = np.where(np.isnan(areas), -1, areas)
+
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+
+    return indices
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Keeps the minimum and maximum of every bucket, in time order; cheaper than LTTB and keeps every extreme.
+    """
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1]
+    filled_low = np.where(np.isnan(y), np.inf, y)
+    filled_high = np.where(np.isnan(y), -np.inf, y)
+
+    lows = np.empty(n_buckets, dtype=np.int64)
+    highs = np.empty(n_buckets, dtype=np.int64)
+    bounds = np.append(edges, n)
+    for bucket in range(n_buckets):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        lows[bucket] = start + np.argmin(filled_low[start:end])
+        highs[bucket] = start + np.argmax(filled_high[start:end])
+
+    return np.unique(np.concatenate((lows, highs, [0, n - 1])))
+
+
+def downsample_series(x, y, n_out, method='lttb'):
+    """
+    Reduces (x, y) to about n_out points with LTTB ('lttb') or min/max bucketing ('minmax').
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if method == 'minmax':
+        indices = minmax_indices(y, max(1, n_out // 2))
+    else:
+        indices = lttb_indices(x, y, n_out)
+    return x[indices], y[indices]
+
+
+def bucket_envelope(x, y, n_buckets):
+    """
+    Returns (bucket start x, bucket maximum y) for step/fill drawing of bar-like series such as volume.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_buckets >= n:
+        return x, y
+
+    starts = np.unique(np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1])
+    return x[starts], np.fmax.reduceat(y, starts)
@@ -1,53 +1,110 @@
-from Historic_Crypto import Cryptocurrencies, HistoricalData#, LiveCryptoData
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import datetime
-import glob
 import os
 
+from candles_client import COINBASE_API_URL, DEFAULT_PAGE_WORKERS, DEFAULT_REQUESTS_PER_SECOND, CandlesClient, TokenBucket
+from data_manifest import load_manifest, record_data_file
+from fetch_journal import FetchJournal
+from product_catalog import DEFAULT_CATALOG_TTL_HOURS, listed_pairs, refresh_catalog
+from profiling import profile_stage
+from resampler import resample_all
+from result_cache import ResultCache
+from storage import DEFAULT_FORMAT, append_parts, format_epoch, ohlcv_filename, read_ohlcv, remove_ohlcv, storage_format, to_epoch_seconds, write_ohlcv
 
 
 
 
 
 
-def fetch_all_currency_pairs():
+
+def fetch_all_currency_pairs(client=None, catalog_ttl_hours=DEFAULT_CATALOG_TTL_HOURS, refresh=False):
   """
-  Fetches all available currency pairs from the Historical_Crypto library.
+  Returns the online currency pairs of the product catalog.
+
+  The exchange's product list is only requested when the cached catalog is
+  older than catalog_ttl_hours (or with refresh), so repeated runs skip it.
   """
-  currency_pairs = Cryptocurrencies().find_crypto_pairs()
-  return currency_pairs
+  catalog = refresh_catalog(client or CandlesClient(), catalog_ttl_hours, refresh)
+  return listed_pairs(catalog)
 
 
-def download_historical_data(currency_pair, interval, start_date, end_date, file_path):
-  """
-  Retrieves historical data for a given currency pair and interval and saves it to a CSV file.
+def download_historical_data(currency_pair, interval, start_date, end_date, file_path, fmt=DEFAULT_FORMAT, client=None, previous_file=None, journal=None):
   """
-  historical_data = HistoricalData(currency_pair, interval, start_date, end_date)
-  data = historical_data.retrieve_data()
+  Retrieves historical data for a given currency pair and interval, saves it in the given
+  storage format and records the new file in the data manifest.
 
+  With previous_file the downloaded candles are appended to that file's data; candles
+  present in both keep the downloaded values. The previous file is only removed once
+  the combined file is written and recorded.
 
-  last_time = data.index[-1].strftime('%Y-%m-%d-%H-%M')
-  filename = f"{file_path}/data/{interval}/{currency_pair}_{interval}_{last_time}.csv"
+  With a journal, the pages of a long backfill are spooled next to the data and the
+  journal's page cursor follows them, so a resumed run only requests the missing pages.
+
+  Returns the saved filename, or None when the exchange has no candles in the range.
+  """
+  client = client or CandlesClient()
+  spool = progress = None
+  if journal is not None:
+    spool = journal.page_spool(currency_pair)
+    progress = lambda pages_done, pages: journal.update_cursor(currency_pair, pages_done, pages, start_date, end_date)
+  with profile_stage('network', currency_pair):
+    data = client.retrieve_data(currency_pair, interval, start_date, end_date, spool, progress)
+  if data.empty:
+    print(f"\n No data for {currency_pair} between {start_date} and {end_date}\n\n")
+    if spool is not None:
+      spool.clear()
+    return None
+
+  data = data.reset_index()
+  base_path = f"{file_path}/data/{interval}"
+  if previous_file and storage_format(previous_file) == 'parts':
+    # Partitioned files take the new candles in place; only the newest partition is rewritten
+    filename = f"{base_path}/{ohlcv_filename(currency_pair, interval, data['time'].iloc[-1], 'parts')}"
+    with profile_stage('write', currency_pair):
+      append_parts(previous_file, data, filename)
+      record_data_file(base_path, currency_pair, filename)
+    ResultCache().invalidate(currency_pair, interval)
+    if spool is not None:
+      spool.clear()
+    print(f"\n This file is saved: {filename}\n\n")
+    return filename
+
+  if previous_file:
+    with profile_stage('load', currency_pair):
+      previous_data = read_ohlcv(previous_file)
+    with profile_stage('filter', currency_pair):
+      data = pd.concat([previous_data, data], ignore_index=True)
+      data = data.drop_duplicates(subset='time', keep='last').sort_values('time', ignore_index=True)
+
+
+  filename = f"{base_path}/{ohlcv_filename(currency_pair, interval, data['time'].iloc[-1], fmt)}"
   print(f'filepath: {file_path}')
-  data.reset_index().to_csv(filename, index=False)
+  with profile_stage('write', currency_pair):
+    write_ohlcv(data, filename)
+    record_data_file(base_path, currency_pair, filename, to_epoch_seconds(data['time']))
+    if previous_file and os.path.abspath(previous_file) != os.path.abspath(filename):
+      remove_ohlcv(previous_file)
+  # Cached analyses of the old data would never be hit again
+  ResultCache().invalidate(currency_pair, interval)
+  if spool is not None:
+    spool.clear()
   print(f"\n This file is saved: {filename}\n\n")
+  return filename
 
-def get_previous_filedata(files):
+def get_previous_filedata(base_path, entry):
     """
-    Extracts the first and last time value from a CSV file.
+    Extracts the first and last time value of a data file from its manifest entry.
 
     Args:
-        filename (str): The path to the CSV file.
+        base_path (str): The data/{interval} directory holding the file.
+        entry (dict): The manifest entry of the currency pair.
     """
-    # Read the CSV file
-    filename = files[0]
-    data = pd.read_csv(filename)
-
-    print('headers: ', data)
+    filename = os.path.join(base_path, entry['file'])
 
     # Extract the first and last time value
-    start_date = data['time'][0] + '-00-00'
-    file_enddate = list(data['time'])[-1] + '-00-00'
+    start_date = format_epoch(entry['first_time'])
+    file_enddate = format_epoch(entry['last_time'])
 
 
     return (start_date, file_enddate, filename)
@@ -58,12 +115,112 @@ def get_previous_filedata(files):
 
 
 
-def fetch_download_all_cryptocurrencies(interval=86400):
-  script_directory = os.path.dirname(os.path.abspath(__file__))
+def fetch_currency_pair(currency_pair, interval, manifest, script_directory, fmt=DEFAULT_FORMAT, client=None, end_date=None, journal=None):
+  """
+  Brings one currency pair up to end_date (default: yesterday) and returns a short status for the final report.
+  """
+  base_path = f"{script_directory}/data/{interval}"
+  print(currency_pair)
+
+
+  entry = manifest['pairs'].get(currency_pair)
+  if entry is not None and (entry['rows'] == 0 or not os.path.exists(os.path.join(base_path, entry['file']))):
+    entry = None
+
+  start_date, file_enddate, filename = get_previous_filedata(base_path, entry) if entry else ('2008-11-16-00-00', 'None', None)
+  end_date = end_date or default_end_date()
+
+
+  print(f"\n\ncurrency_pair: {currency_pair}\ninterval: {interval}\nstart_date: {start_date}\nend_date: {end_date}")
+  print('file: ', filename)
+
+  if end_date == file_enddate:
+    print(f"\n Current file already exist\n\n")
+    return 'up to date'
+
+  if filename:
+    # Only request candles from the last stored one on; it is fetched again because it may have been incomplete
+    print(currency_pair, file_enddate)
+    saved = download_historical_data(currency_pair, interval, file_enddate, end_date, script_directory, storage_format(filename), client, previous_file=filename, journal=journal)
+    return 'appended' if saved else 'up to date'
+
+  print(currency_pair, start_date)
+  saved = download_historical_data(currency_pair, interval, start_date, end_date, script_directory, fmt, client, journal=journal)
+  return 'downloaded' if saved else 'no data'
+
 
+def default_end_date():
+  return (datetime.datetime.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d') + '-00-00'
 
-  currency_pairs = fetch_all_currency_pairs()
 
+def job_staleness(manifest, currency_pair, end_date):
+  """
+  Seconds the stored data of a pair lags behind end_date; pairs without data are infinitely stale.
+  """
+  entry = manifest['pairs'].get(currency_pair)
+  if entry is None or not entry['rows']:
+    return float('inf')
+  end = datetime.datetime.strptime(end_date, '%Y-%m-%d-%H-%M').replace(tzinfo=datetime.timezone.utc).timestamp()
+  return end - entry['last_time']
+
+
+def fetch_download_all_cryptocurrencies(
+    intervals=86400,
+    fmt=DEFAULT_FORMAT,
+    workers=1,
+    requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+    api_url=COINBASE_API_URL,
+    resample_intervals=None,
+    page_workers=DEFAULT_PAGE_WORKERS,
+    resume=False,
+    catalog_ttl_hours=DEFAULT_CATALOG_TTL_HOURS,
+    refresh_catalog=False,
+):
+  """
+  Brings every online pair up to date in one or more intervals, recording the run in
+  the fetch journal of each interval.
+
+  All (pair, interval) jobs are planned together and share one client, so one
+  connection pool and one rate budget; the most stale jobs (missing files first)
+  run first, and every interval is fetched up to the same end date.
+
+  With resume, the pairs each interval's last run left planned, in flight or failed
+  are fetched up to that run's end date, without listing the exchange's pairs again.
+  """
+  intervals = [intervals] if isinstance(intervals, int) else list(intervals)
+  script_directory = os.path.dirname(os.path.abspath(__file__))
+
+  # One client for all workers, so they share the connection pool and the rate limit;
+  # long backfills request several pages of a pair at once, so latency is not the bottleneck
+  client = CandlesClient(
+    api_url,
+    rate_limiter=TokenBucket(requests_per_second),
+    page_workers=page_workers,
+    pool_size=max(1, workers) * max(1, page_workers),
+  )
+
+  journals = {}
+  if resume:
+    for interval in intervals:
+      base_path = f"{script_directory}/data/{interval}"
+      journal = FetchJournal.load(base_path) if os.path.isdir(base_path) else None
+      if journal is None or not journal.unfinished_pairs():
+        print(f"\n No unfinished fetch run to resume in {base_path}\n\n")
+        continue
+      print(f"Resuming fetch run of {journal.data['started']} ({interval}s): {len(journal.unfinished_pairs())} of {len(journal.data['pairs'])} pairs left")
+      journals[interval] = journal
+    if not journals:
+      return {}
+  else:
+    # The pair list is requested (or read from the catalog) once for every interval
+    with profile_stage('discovery'):
+      currency_pairs = fetch_all_currency_pairs(client, catalog_ttl_hours, refresh_catalog)
+    end_date = default_end_date()
+    for interval in intervals:
+      base_path = f"{script_directory}/data/{interval}"
+      os.makedirs(base_path, exist_ok=True)
+      journals[interval] = FetchJournal(base_path, interval, end_date, currency_pairs)
+      journals[interval].save()
 
 
 
@@ -73,27 +230,61 @@ def fetch_download_all_cryptocurrencies(interval=86400):
   print('#####################################################')
   print('#####################################################')
 
-  for currency_pair in currency_pairs[currency_pairs['status'] == 'online']['id'].tolist():
-    print(currency_pair)
-  
-  
-    files = glob.glob(f"data/{interval}/{currency_pair}_{interval}*.csv")
-  
-    start_date, file_enddate, filename = get_previous_filedata(files) if files else ('2008-11-16-00-00', 'None', None)
-    end_date = (datetime.datetime.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d') + '-00-00'
-  
-  
-    print(f"\n\ncurrency_pair: {currency_pair}\ninterval: {interval}\nstart_date: {start_date}\nend_date: {end_date}")
-    print('files: ', files)
-  
-    print(f"\n\n{end_date} | {file_enddate}\n{type(end_date)} | {type(file_enddate)}\n{end_date != file_enddate}\n\n")
-    if end_date != file_enddate:
-      if filename:
-        os.remove(filename)
-      print(currency_pair, start_date)
-      download_historical_data(currency_pair, interval, start_date, end_date, script_directory)
+  # The manifests know every pair's current file and time range without touching the files
+  with profile_stage('resolve'):
+    manifests = {interval: load_manifest(f"{script_directory}/data/{interval}") for interval in journals}
+
+  jobs = [(currency_pair, interval) for interval, journal in journals.items() for currency_pair in journal.unfinished_pairs()]
+  jobs.sort(key=lambda job: -job_staleness(manifests[job[1]], job[0], journals[job[1]].end_date))
+
+  def fetch_reported(job):
+    currency_pair, interval = job
+    journal = journals[interval]
+    journal.mark(currency_pair, 'in-flight')
+    try:
+      status = fetch_currency_pair(currency_pair, interval, manifests[interval], script_directory, fmt, client, journal.end_date, journal)
+    except Exception as error:
+      print(f"\n Failed to fetch {currency_pair} ({interval}s): {error}\n\n")
+      journal.mark(currency_pair, 'failed', error=str(error))
     else:
-      print(f"\n Current file already exist\n\n")
+      journal.mark(currency_pair, 'completed', result=status)
+
+  with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+    list(executor.map(fetch_reported, jobs))
+
+  # The journals also hold the pairs finished before a resume; with several
+  # intervals the report is keyed 'PAIR@interval' like the resample report
+  if len(journals) == 1:
+    report = next(iter(journals.values())).report()
+  else:
+    report = {f"{currency_pair}@{interval}": status for interval, journal in journals.items() for currency_pair, status in journal.report().items()}
+
+  print_fetch_report(report)
+
+  # Coarser intervals are built locally from the finest fetched candles instead of fetched again
+  if resample_intervals:
+    with profile_stage('resample'):
+      resample_report = resample_all(None, min(intervals), resample_intervals)
+    print_fetch_report(resample_report, 'RESAMPLE REPORT')
+    report.update(resample_report)
+  return report
+
+
+def print_fetch_report(report, title='FETCH REPORT'):
+  """
+  Prints the per-pair outcome of a fetch (or resample) run followed by totals per outcome.
+  """
+  print('#####################################################')
+  print(f'################  {title}  '.ljust(53, '#'))
+  print('#####################################################')
+  for currency_pair, status in sorted(report.items()):
+    print(f"{currency_pair}: {status}")
+
+  totals = {}
+  for status in report.values():
+    outcome = status.split(':')[0]
+    totals[outcome] = totals.get(outcome, 0) + 1
+  print(', '.join(f"{outcome}: {count}" for outcome, count in sorted(totals.items())))
 
 
 
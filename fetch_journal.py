@@ -0,0 +1,164 @@
+import datetime
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+
+
+
+
+
+# Kept next to the manifest in every data/{interval}/ directory
+JOURNAL_NAME = 'fetch_journal.json'
+
+# Pages of unfinished backfills, one directory per pair, removed once the pair is saved
+SPOOL_DIR_NAME = 'spool'
+
+JOURNAL_STATES = ['planned', 'in-flight', 'completed', 'failed']
+
+
+def journal_path(base_path):
+  return os.path.join(base_path, JOURNAL_NAME)
+
+
+def _now():
+  return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+class FetchJournal:
+  """
+  Persistent record of one fetch run: the end date and the state of every pair.
+
+  Pairs move from planned to in-flight to completed or failed, and long
+  backfills keep a page cursor (pages done out of pages planned). Every change
+  is written through a temp file and a rename, so a killed run always leaves
+  a readable journal behind, which fetch --resume continues from.
+  """
+  def __init__(self, base_path, interval, end_date, currency_pairs=()):
+    self.base_path = base_path
+    self.lock = threading.Lock()
+    self.data = {
+      'interval': interval,
+      'end_date': end_date,
+      'started': _now(),
+      'updated': None,
+      'pairs': {currency_pair: {'status': 'planned'} for currency_pair in currency_pairs},
+    }
+
+  @classmethod
+  def load(cls, base_path):
+    """
+    Returns the journal of the last fetch run in base_path, or None if there is none.
+    """
+    try:
+      with open(journal_path(base_path)) as journal_file:
+        data = json.load(journal_file)
+    except (OSError, ValueError):
+      return None
+    journal = cls(base_path, data['interval'], data['end_date'])
+    journal.data = data
+    return journal
+
+  def save(self):
+    with self.lock:
+      self._save()
+
+  def _save(self):
+    self.data['updated'] = _now()
+    tmp_path = f'{journal_path(self.base_path)}.tmp'
+    with open(tmp_path, 'w') as journal_file:
+      json.dump(self.data, journal_file, indent=1, sort_keys=True)
+    os.replace(tmp_path, journal_path(self.base_path))
+
+  @property
+  def end_date(self):
+    return self.data['end_date']
+
+  def pairs_with_status(self, *statuses):
+    return [currency_pair for currency_pair, entry in self.data['pairs'].items() if entry['status'] in statuses]
+
+  def unfinished_pairs(self):
+    """
+    Pairs a resumed run still has to fetch: everything not completed, failed pairs included.
+    """
+    return self.pairs_with_status('planned', 'in-flight', 'failed')
+
+  def mark(self, currency_pair, status, **fields):
+    """
+    Moves a pair to a new state; fields (result, error) replace the ones of its previous state.
+    """
+    if status not in JOURNAL_STATES:
+      raise ValueError(f"Unknown fetch state: {status}")
+    with self.lock:
+      entry = {'status': status, 'updated': _now(), **fields}
+      cursor = self.data['pairs'].get(currency_pair, {}).get('cursor')
+      if cursor is not None and status in ('in-flight', 'failed'):
+        entry['cursor'] = cursor
+      self.data['pairs'][currency_pair] = entry
+      self._save()
+
+  def update_cursor(self, currency_pair, pages_done, pages, start_date, end_date):
+    with self.lock:
+      self.data['pairs'][currency_pair]['cursor'] = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'pages': pages,
+        'pages_done': pages_done,
+      }
+      self._save()
+
+  def report(self):
+    """
+    Returns {pair: status} for the fetch report, covering the pairs of earlier attempts as well.
+    """
+    report = {}
+    for currency_pair, entry in self.data['pairs'].items():
+      if entry['status'] == 'completed':
+        report[currency_pair] = entry.get('result', 'completed')
+      elif entry['status'] == 'failed':
+        report[currency_pair] = f"failed: {entry.get('error')}"
+      else:
+        report[currency_pair] = entry['status']
+    return report
+
+  def page_spool(self, currency_pair):
+    return PageSpool(os.path.join(self.base_path, SPOOL_DIR_NAME, currency_pair))
+
+
+class PageSpool:
+  """
+  Pages of one backfill fetched so far, one .npy file per page window.
+
+  Files are named after the epoch bounds of their window, so a resumed backfill
+  of the same range loads them instead of requesting them again.
+  """
+  def __init__(self, path):
+    self.path = path
+
+  def _page_path(self, window):
+    first, last = (int(moment.replace(tzinfo=datetime.timezone.utc).timestamp()) for moment in window)
+    return os.path.join(self.path, f'{first}_{last}.npy')
+
+  def get(self, window):
+    try:
+      return np.load(self._page_path(window))
+    except (OSError, ValueError):
+      return None
+
+  def put(self, window, page):
+    os.makedirs(self.path, exist_ok=True)
+    page_path = self._page_path(window)
+    tmp_path = f'{page_path}.tmp.npy'
+    np.save(tmp_path, page)
+    os.replace(tmp_path, page_path)
+
+  def clear(self):
+    shutil.rmtree(self.path, ignore_errors=True)
+    try:
+      os.rmdir(os.path.dirname(self.path))
+    except OSError:
+      # Other pairs still have pages spooled
+      pass
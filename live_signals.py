@@ -0,0 +1,220 @@
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import time
+
+import numpy as np
+
+from candles_client import COINBASE_API_URL, DEFAULT_REQUESTS_PER_SECOND, CandlesClient, TokenBucket
+from storage import DEFAULT_CHUNKSIZE, format_epoch, iter_ohlcv_chunks, parse_ohlcv_filename
+
+
+
+
+
+
+
+class PairState:
+  """
+  Streak counter, open position and running balance of one currency pair.
+
+  update() applies one candle in O(1) with the same rules as find_consecutive_days
+  and calculate_profits, so replaying a history candle by candle gives the same
+  positions and final balance as the batch analysis.
+  """
+  def __init__(self, currency_pair, price_tolerance, volume_tolerance, num_consecutive_days=3, investment_amount=100):
+    self.currency_pair = currency_pair
+    self.price_tolerance = price_tolerance
+    self.volume_tolerance = volume_tolerance
+    self.num_consecutive_days = num_consecutive_days
+    self.investment_amount = investment_amount
+
+    self.previous_price = None
+    self.previous_volume = None
+    self.last_time = None
+    self.counter = 1
+    self.entry_time = None
+    self.entry_price = None
+    self.balance = investment_amount
+    self.trades = 0
+    self.rows = 0
+
+  def update(self, candle_time, open_price, close_price, volume):
+    """
+    Applies the next candle and returns an 'entry' or 'exit' event dict, or None.
+    """
+    # max(open, close) ignoring NaN, like build_price_series
+    price = open_price if close_price != close_price or open_price > close_price else close_price
+    previous_price, previous_volume = self.previous_price, self.previous_volume
+    self.previous_price, self.previous_volume = price, volume
+    self.last_time = candle_time
+    self.rows += 1
+
+    # The first candle only seeds the comparison
+    if previous_price is None:
+      return None
+
+    is_price_higher_or_close = price >= previous_price - previous_price * self.price_tolerance
+    is_volume_higher_or_close = volume >= previous_volume - previous_volume * self.volume_tolerance
+
+    if is_price_higher_or_close and is_volume_higher_or_close:
+      self.counter += 1
+      if self.counter == self.num_consecutive_days and self.entry_price is None:
+        self.entry_time, self.entry_price = candle_time, close_price
+        return self._event('entry', candle_time, close_price)
+      return None
+
+    self.counter = 0
+    if self.entry_price is None:
+      return None
+
+    profit = (close_price - self.entry_price) / self.entry_price
+    self.balance *= 1 + profit
+    self.trades += 1
+    event = self._event('exit', candle_time, close_price, profit=profit * 100, entry_time=self.entry_time)
+    self.entry_time, self.entry_price = None, None
+    return event
+
+  def _event(self, kind, candle_time, price, **extra):
+    return {
+      'currency_pair': self.currency_pair,
+      'event': kind,
+      'time': int(candle_time),
+      'price': float(price),
+      'balance': float(self.balance),
+      **extra,
+    }
+
+
+def print_event(event):
+  line = f"{format_epoch(event['time'], '%Y-%m-%d %H:%M')} {event['currency_pair']} {event['event'].upper()} at {event['price']:.8g}"
+  if event['event'] == 'exit':
+    line += f", profit {event['profit']:.2f}%, balance {event['balance']:.2f}"
+  print(line)
+
+
+def replay_feed(files, start_from=0, chunksize=DEFAULT_CHUNKSIZE):
+  """
+  Yields (time, currency_pair, open, close, volume) candles from stored files, merged in time order.
+
+  Each file is read chunk by chunk, so hundreds of pairs can be replayed in one process.
+  """
+  def candles(path):
+    currency_pair = parse_ohlcv_filename(path)[0]
+    for first_row, arrays in iter_ohlcv_chunks(path, ['time', 'open', 'close', 'volume'], chunksize, start_row=start_from):
+      for candle_time, open_price, close_price, volume in zip(
+        arrays['time'].tolist(), arrays['open'].tolist(), arrays['close'].tolist(), arrays['volume'].tolist()
+      ):
+        yield candle_time, currency_pair, open_price, close_price, volume
+
+  return heapq.merge(*[candles(path) for path in files])
+
+
+def polling_feed(client, last_times, interval, poll_seconds=60, workers=4, max_polls=None):
+  """
+  Polls the candles endpoint for every pair and yields each newly closed candle once, in time order.
+
+  Args:
+      last_times (dict): currency pair -> epoch time of the last candle already seen; updated in place.
+      max_polls (int): stop after this many polling rounds; None polls forever.
+  """
+  def poll(currency_pair):
+    now = int(time.time())
+    start = last_times[currency_pair] + interval
+    # Only candles whose interval has ended are final
+    end = (now // interval) * interval - interval
+    if end < start:
+      return []
+    data = client.retrieve_data(currency_pair, interval, format_epoch(start), format_epoch(end))
+    candle_times = data.index.values.astype('datetime64[s]').astype(np.int64)
+    return [
+      (int(candle_time), currency_pair, float(row.open), float(row.close), float(row.volume))
+      for candle_time, row in zip(candle_times, data.itertuples())
+      if candle_time > last_times[currency_pair]
+    ]
+
+  def poll_reported(currency_pair):
+    try:
+      return poll(currency_pair)
+    except Exception as error:
+      print(f"Failed to poll {currency_pair}: {error}")
+      return []
+
+  polls = 0
+  with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+    while max_polls is None or polls < max_polls:
+      new_candles = []
+      for result in executor.map(poll_reported, list(last_times)):
+        new_candles.extend(result)
+
+      for candle in sorted(new_candles):
+        last_times[candle[1]] = max(last_times[candle[1]], candle[0])
+        yield candle
+
+      polls += 1
+      if max_polls is None or polls < max_polls:
+        time.sleep(poll_seconds)
+
+
+def run_feed(feed, states):
+  """
+  Feeds candles into their pair states and yields every entry/exit event as it happens.
+  """
+  for candle_time, currency_pair, open_price, close_price, volume in feed:
+    event = states[currency_pair].update(candle_time, open_price, close_price, volume)
+    if event is not None:
+      yield event
+
+
+def follow_signals(
+    latest_selected_files,
+    price_tolerance,
+    volume_tolerance,
+    num_consecutive_days = 3,
+    interval = 86400,
+    start_from = 0,
+    replay = False,
+    poll_seconds = 60,
+    api_url = COINBASE_API_URL,
+    requests_per_second = DEFAULT_REQUESTS_PER_SECOND,
+    workers = 4,
+    max_polls = None,
+):
+  """
+  Keeps one PairState per data file and emits entry/exit events as candles arrive.
+
+  The stored history is replayed first to bring every state up to date. With
+  replay that is all, and every historical event is printed; otherwise the
+  exchange is then polled for new candles every poll_seconds.
+  """
+  states = {}
+  for path in latest_selected_files:
+    currency_pair = parse_ohlcv_filename(path)[0]
+    states[currency_pair] = PairState(currency_pair, price_tolerance, volume_tolerance, num_consecutive_days)
+
+  for event in run_feed(replay_feed(latest_selected_files, start_from), states):
+    if replay:
+      print_event(event)
+  print_states(states)
+  if replay:
+    return states
+
+  # Follow the pairs whose history ends where polling can pick up
+  last_times = {currency_pair: state.last_time for currency_pair, state in states.items() if state.last_time is not None}
+  client = CandlesClient(api_url, rate_limiter=TokenBucket(requests_per_second))
+  print(f"Following {len(last_times)} pairs every {poll_seconds}s")
+  try:
+    for event in run_feed(polling_feed(client, last_times, interval, poll_seconds, workers, max_polls), states):
+      print_event(event)
+  except KeyboardInterrupt:
+    pass
+  print_states(states)
+  return states
+
+
+def print_states(states):
+  """
+  Prints the current streak, open position and balance of every pair.
+  """
+  for currency_pair, state in sorted(states.items()):
+    position = f"open since {format_epoch(state.entry_time, '%Y-%m-%d %H:%M')} at {state.entry_price:.8g}" if state.entry_price is not None else 'flat'
+    print(f"{currency_pair}: streak {state.counter}, {position}, {state.trades} trades, balance {state.balance:.2f}")
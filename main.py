@@ -1,9 +1,18 @@
 import argparse
+import cProfile
 import datetime
+import os
+import pstats
+import sys
 
-from fetch_download_currencies import fetch_download_all_cryptocurrencies
-from consecutivedays_analyzer import consecutivedays_analyzer
-from parallel_plotter import parallel_plotter
+# Option constants come from the dependency-free defaults module; every command imports
+# its own subsystem in run_command, so e.g. fetch never loads matplotlib or the analyzer
+from defaults import (
+    BENCH_STAGES, COINBASE_API_URL, DEFAULT_CACHE_MB, DEFAULT_CATALOG_TTL_HOURS, DEFAULT_CHUNKSIZE, DEFAULT_FORMAT,
+    DEFAULT_PAGE_WORKERS, DEFAULT_REQUESTS_PER_SECOND, DEFAULT_THRESHOLD, FORMAT_EXTENSIONS, GAP_MODES, IMAGE_FORMATS,
+    SCREEN_FORMATS,
+)
+from profiling import append_metrics, profiler
 
 
 
@@ -11,14 +20,72 @@ from parallel_plotter import parallel_plotter
 # TODO: Use QTPyLib and⁄or quantstats
 
 
+def int_at_least(minimum):
+    """
+    Returns an argparse type for counts and sizes that must be at least minimum.
+    """
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid int value: '{text}'")
+        if value < minimum:
+            raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {value}")
+        return value
+    return parse
+
+
+def signal_rule(text):
+    """
+    argparse type of --rule: compiles the rule while parsing, so a malformed one is a usage error.
+    """
+    from signal_rules import compile_rule
+
+    try:
+        compile_rule(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return text
+
+
 def main():
     parser = argparse.ArgumentParser(description='Cryptocurrency Data Analysis Tool')
+    # example: python3 main.py --profile --metrics-json metrics.json analyze -c 'DOGE-USD' -p 0.01 -v 0.1
+    parser.add_argument('--profile', action='store_true', default=False, help='Print the time spent in every stage, per pair and for the whole run')
+    parser.add_argument('--metrics-json', type=str, default=None, help='Append the stage timings of this run to a JSON file')
+    parser.add_argument('--cprofile', type=str, default=None, help='Also run under cProfile, save the stats to this file and print the hottest functions')
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     # Subparser for fetching and downloading cryptocurrency data
     # example: python3 main.py fetch
     fetch_parser = subparsers.add_parser('fetch', help='Fetch and download cryptocurrency data')
-    fetch_parser.add_argument('-i', '--interval', type=int, default=86400, help='Interval in seconds for data fetch; default=86400')
+    fetch_parser.add_argument('-i', '--interval', type=int, nargs='+', default=[86400], help='Intervals in seconds for data fetch, fetched together in one run, e.g. -i 60 3600 86400; default=86400')
+    fetch_parser.add_argument('-w', '--workers', type=int, default=1, help='Number of pairs fetched concurrently; default=1')
+    fetch_parser.add_argument('--rate', type=float, default=DEFAULT_REQUESTS_PER_SECOND, help=f'Maximum requests per second shared by all workers; default={DEFAULT_REQUESTS_PER_SECOND}')
+    fetch_parser.add_argument('--page-workers', type=int, default=DEFAULT_PAGE_WORKERS, help=f'Pages of one pair requested concurrently during long backfills; default={DEFAULT_PAGE_WORKERS}')
+    fetch_parser.add_argument('--api-url', type=str, default=COINBASE_API_URL, help=f'Base URL of the candles API, e.g. a local stand-in; default={COINBASE_API_URL}')
+    fetch_parser.add_argument('-f', '--format', choices=sorted(FORMAT_EXTENSIONS), default=DEFAULT_FORMAT, help=f'Storage format for new data files; default={DEFAULT_FORMAT}')
+    fetch_parser.add_argument('--catalog-ttl', type=float, default=DEFAULT_CATALOG_TTL_HOURS, help=f'Hours the cached product catalog is used before the pair list is requested again; default={DEFAULT_CATALOG_TTL_HOURS}')
+    fetch_parser.add_argument('--refresh-catalog', action='store_true', help='Request the pair list from the exchange even if the cached catalog is fresh')
+    fetch_parser.add_argument('--resume', action='store_true', help='Continue the last fetch run of the interval from its journal instead of starting over')
+    fetch_parser.add_argument('-R', '--resample', type=int, nargs='+', default=None, help='Coarser intervals in seconds to build locally from the fetched interval, e.g. -i 60 -R 3600 86400')
+
+    # Subparser for building coarser intervals from the finest stored one
+    # example: python3 main.py resample -b 60 -i 3600 86400
+    resample_parser = subparsers.add_parser('resample', help='Build coarser intervals from stored finer candles')
+    resample_parser.add_argument('-b', '--base-interval', type=int, default=60, help='Interval in seconds of the stored candles to aggregate; default=60')
+    resample_parser.add_argument('-i', '--intervals', type=int, nargs='+', default=[3600, 86400], help='Target intervals in seconds, multiples of the base interval; default=3600 86400')
+    resample_parser.add_argument('-c', '--currency_pairs', nargs='+', help='List of cryptocurrency pairs to resample; default=all pairs of the base interval')
+    resample_parser.add_argument('--rebuild', action='store_true', default=False, help='Rebuild the target files from scratch instead of updating their last bars; default=False')
+    resample_parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help=f'Rows of base candles read at a time; default={DEFAULT_CHUNKSIZE}')
+
+    # Subparser for converting stored data between storage formats
+    # example: python3 main.py migrate -f npcol
+    # example: python3 main.py migrate -f csv --keep
+    migrate_parser = subparsers.add_parser('migrate', help='Convert stored data files to another storage format')
+    migrate_parser.add_argument('-f', '--format', choices=sorted(FORMAT_EXTENSIONS), required=True, help='Target storage format; csv doubles as the export format')
+    migrate_parser.add_argument('-i', '--interval', type=int, default=86400, help='Interval in seconds of the data to convert; default=86400')
+    migrate_parser.add_argument('-k', '--keep', action='store_true', default=False, help='Keep the source files after conversion; default=False')
 
     # Subparser for analyzing consecutive days
     # example: python3 main.py analyze -c 'DOGE-USD' -p 0.01 -v 0.01
@@ -30,6 +97,64 @@ def main():
     analyze_parser.add_argument('-s', '--start_from', type=int, default=0, help='Starting index for data analysis; default=0')
     analyze_parser.add_argument('-r', '--remove_lastdatapoints', type=int, default=0, help='Data points to remove from the end of the dataset; default=0')
     analyze_parser.add_argument('-i', '--interval', type=int, default=86400, help='Interval in seconds for data analysis; default=86400')
+    analyze_parser.add_argument('-o', '--output-dir', type=str, default=None, help='Save every chart into this directory with an index page instead of showing windows')
+    analyze_parser.add_argument('-f', '--format', choices=IMAGE_FORMATS, default='png', help='Image format for --output-dir; default=png')
+    analyze_parser.add_argument('-w', '--workers', type=int, default=None, help='Number of render processes for --output-dir; default=number of CPUs')
+    analyze_parser.add_argument('--no-downsample', dest='downsample', action='store_false', default=True, help='Draw every candle instead of reducing the series to the chart width; default=False')
+    analyze_parser.add_argument('--chunksize', type=int, default=None, help='Stream each file in chunks of this many rows so memory does not grow with the history length; default=off')
+    analyze_parser.add_argument('--follow', action='store_true', default=False, help='Replay the stored history into per-pair states, then poll the exchange and print entry/exit events as candles close')
+    analyze_parser.add_argument('--replay', action='store_true', default=False, help='Print the entry/exit events of a candle-by-candle replay of the stored files and stop')
+    analyze_parser.add_argument('--poll-seconds', type=float, default=60, help='Seconds between polls in --follow mode; default=60')
+    analyze_parser.add_argument('--no-cache', dest='use_cache', action='store_false', default=True, help='Recompute every result instead of using the on-disk result cache')
+    analyze_parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_MB, help=f'Size limit of the result cache in MB; default={DEFAULT_CACHE_MB}')
+    analyze_parser.add_argument('--rule', type=signal_rule, default=None, help="Entry condition replacing the close and volume comparison, e.g. 'close >= close[-1] * (1 - p) and volume >= sma(volume, 5)'")
+    analyze_parser.add_argument('--api-url', type=str, default=COINBASE_API_URL, help=f'Base URL of the candles API for --follow; default={COINBASE_API_URL}')
+
+    # Subparser for sweeping analyze parameters over a grid
+    # example: python3 main.py sweep -c 'DOGE-USD' -p 0.005:0.05:0.005 -v 0.01 0.05 0.1 -n 2:4:1
+    sweep_parser = subparsers.add_parser('sweep', help='Rank analyze parameter combinations by CAGR without plotting')
+    sweep_parser.add_argument('-c', '--currency_pairs', nargs='+', required=True, help='List of cryptocurrency pairs to sweep')
+    sweep_parser.add_argument('-p', '--price_tolerance', nargs='+', required=True, help="Price tolerance values or 'start:stop:step' ranges")
+    sweep_parser.add_argument('-v', '--volume_tolerance', nargs='+', required=True, help="Volume tolerance values or 'start:stop:step' ranges")
+    sweep_parser.add_argument('-n', '--num_consecutive_days', nargs='+', default=['3'], help="Consecutive day values or 'start:stop:step' ranges; default=3")
+    sweep_parser.add_argument('-s', '--start_from', type=int, default=0, help='Starting index for data analysis; default=0')
+    sweep_parser.add_argument('-r', '--remove_lastdatapoints', type=int, default=0, help='Data points to remove from the end of the dataset; default=0')
+    sweep_parser.add_argument('-i', '--interval', type=int, default=86400, help='Interval in seconds for data analysis; default=86400')
+    sweep_parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes; default=number of CPUs')
+    sweep_parser.add_argument('-t', '--top', type=int, default=20, help='Number of best combinations to print per pair; default=20')
+    sweep_parser.add_argument('-o', '--output', type=str, default=None, help='Optional CSV file for the full ranked table')
+
+    # Subparser for walk-forward optimization of analyze parameters
+    # example: python3 main.py walkforward -c 'DOGE-USD' -p 0:0.05:0.005 -v 0.05 0.1 0.5 -n 2:4:1 --train 365 --test 90
+    walkforward_parser = subparsers.add_parser('walkforward', help='Pick parameters on rolling train windows and score them out of sample')
+    walkforward_parser.add_argument('-c', '--currency_pairs', nargs='+', help='List of cryptocurrency pairs; default=every pair in the data directory')
+    walkforward_parser.add_argument('-p', '--price_tolerance', nargs='+', required=True, help="Price tolerance values or 'start:stop:step' ranges")
+    walkforward_parser.add_argument('-v', '--volume_tolerance', nargs='+', required=True, help="Volume tolerance values or 'start:stop:step' ranges")
+    walkforward_parser.add_argument('-n', '--num_consecutive_days', nargs='+', default=['3'], help="Consecutive day values or 'start:stop:step' ranges; default=3")
+    walkforward_parser.add_argument('-s', '--start_from', type=int, default=0, help='Starting index for data analysis; default=0')
+    walkforward_parser.add_argument('-r', '--remove_lastdatapoints', type=int, default=0, help='Data points to remove from the end of the dataset; default=0')
+    walkforward_parser.add_argument('-i', '--interval', type=int, default=86400, help='Interval in seconds for data analysis; default=86400')
+    walkforward_parser.add_argument('--train', type=int, default=365, help='Rows in every train window; default=365')
+    walkforward_parser.add_argument('--test', type=int, default=90, help='Rows in every test window, also the step between folds; default=90')
+    walkforward_parser.add_argument('--anchored', action='store_true', default=False, help='Grow the train window from the first row instead of rolling it; default=False')
+    walkforward_parser.add_argument('-o', '--output', type=str, default=None, help='Optional CSV file for every fold')
+
+    # Subparser for screening every stored pair for active streaks
+    # example: python3 main.py screen -p 0.01 -v 0.1
+    # example: python3 main.py screen -p 0.01 -v 0.1 -f json -o screen.json
+    screen_parser = subparsers.add_parser('screen', help='Report the pairs with an active streak across the whole data directory')
+    screen_parser.add_argument('-c', '--currency_pairs', nargs='+', help='List of cryptocurrency pairs to screen; default=every pair in the data directory')
+    screen_parser.add_argument('-p', '--price_tolerance', type=float, required=True, help='Price tolerance for analysis')
+    screen_parser.add_argument('-v', '--volume_tolerance', type=float, required=True, help='Volume tolerance for analysis')
+    screen_parser.add_argument('-n', '--num_consecutive_days', type=int, default=3, help='Number of consecutive days for analysis; default=3')
+    screen_parser.add_argument('-s', '--start_from', type=int, default=0, help='Starting index for data analysis; default=0')
+    screen_parser.add_argument('-i', '--interval', type=int, default=86400, help='Interval in seconds for data analysis; default=86400')
+    screen_parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes; default=number of CPUs')
+    screen_parser.add_argument('-f', '--format', choices=SCREEN_FORMATS, default='table', help='Report format; default=table')
+    screen_parser.add_argument('-o', '--output', type=str, default=None, help='Write the report to this file instead of printing it')
+    screen_parser.add_argument('--rule', type=signal_rule, default=None, help='Entry condition replacing the close and volume comparison; see analyze --rule')
+    screen_parser.add_argument('--listed', dest='listed_only', action='store_true', default=False, help='Leave out pairs the cached product catalog no longer lists; works offline')
+    screen_parser.add_argument('-a', '--all', action='store_true', default=False, help='Include pairs without an active streak; default=False')
 
     # Subparser for parallel plotting of data
     # example: python3 main.py plot -c 
@@ -41,15 +166,98 @@ def main():
     plot_parser.add_argument('-i', '--interval', type=int, default=86400, help='Interval in seconds for plotting; default=86400')
     plot_parser.add_argument('-z', '--start_from_zero', action='store_false', default=True, help='Whether to start normalization from zero; default=True')
     plot_parser.add_argument('-n', '--normalize_by_percentage_growth', action='store_false', default=True, help='Whether to normalize by percentage growth; default=True')
+    plot_parser.add_argument('-o', '--output-dir', type=str, default=None, help='Save the chart into this directory with an index page instead of showing a window')
+    plot_parser.add_argument('-f', '--format', choices=IMAGE_FORMATS, default='png', help='Image format for --output-dir; default=png')
+    plot_parser.add_argument('--no-downsample', dest='downsample', action='store_false', default=True, help='Draw every point instead of reducing each line to the chart width; default=False')
+    plot_parser.add_argument('-l', '--leaders-csv', type=str, default=None, help='Optional CSV file for the strongest-grower timeline (pair, start, end, periods)')
+    plot_parser.add_argument('--listed', dest='listed_only', action='store_true', default=False, help='Leave out pairs the cached product catalog no longer lists; works offline')
+    plot_parser.add_argument('-g', '--gaps', choices=GAP_MODES, default='nan', help="Missing candles: 'nan' leaves them out, 'ffill' carries the last close forward; default=nan")
     
+    # Subparser for offline benchmarks on synthetic data
+    # example: python3 main.py bench --pairs 100 --rows 100000 -i 3600 --save-baseline
+    # example: python3 main.py bench --pairs 100 --rows 100000 -i 3600
+    bench_parser = subparsers.add_parser('bench', help='Time every stage on synthetic data and compare with a stored baseline')
+    bench_parser.add_argument('--pairs', type=int_at_least(1), default=10, help='Number of synthetic pairs (1 to 1000); default=10')
+    bench_parser.add_argument('--rows', type=int_at_least(2), default=10000, help='Candles per synthetic pair (at least 2; 1k to 10M is typical); default=10000')
+    bench_parser.add_argument('-i', '--interval', type=int_at_least(1), default=86400, help='Interval in seconds of the synthetic candles; default=86400')
+    bench_parser.add_argument('-f', '--format', choices=sorted(FORMAT_EXTENSIONS), default=DEFAULT_FORMAT, help=f'Storage format of the synthetic files; default={DEFAULT_FORMAT}')
+    bench_parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data; default=0')
+    bench_parser.add_argument('--stages', nargs='+', choices=BENCH_STAGES, default=None, help='Stages to time; default=all')
+    bench_parser.add_argument('--repeat', type=int_at_least(1), default=3, help='Timed runs per stage, the best one is kept; default=3')
+    bench_parser.add_argument('-p', '--price_tolerance', type=float, default=0.01, help='Price tolerance for analysis; default=0.01')
+    bench_parser.add_argument('-v', '--volume_tolerance', type=float, default=0.1, help='Volume tolerance for analysis; default=0.1')
+    bench_parser.add_argument('-n', '--num_consecutive_days', type=int_at_least(1), default=3, help='Number of consecutive days for analysis; default=3')
+    bench_parser.add_argument('--data-dir', type=str, default=None, help='Keep and reuse the synthetic data here; default=a temporary directory')
+    bench_parser.add_argument('--history', type=str, default=None, help='JSON history every run is appended to; default=bench/history.json')
+    bench_parser.add_argument('--baseline', type=str, default=None, help='JSON baselines, one per dataset config; default=bench/baseline.json')
+    bench_parser.add_argument('--save-baseline', action='store_true', default=False, help='Store this run as the baseline instead of comparing with it')
+    bench_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help=f'Allowed slowdown or memory growth before failing, as a fraction; default={DEFAULT_THRESHOLD}')
+
     args = parser.parse_args()
+    profiler.enabled = args.profile or bool(args.metrics_json)
+    profiler.reset()
+    profile = cProfile.Profile() if args.cprofile else None
+    if profile:
+        profile.enable()
+    try:
+        run_command(parser, args)
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(args.cprofile)
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(25)
+            print(f"\n This file is saved: {args.cprofile}\n")
+        if args.profile:
+            profiler.print_report()
+        if args.metrics_json:
+            append_metrics(args.metrics_json, profiler.metrics(args.command, sys.argv[1:]))
+            print(f"\n This file is saved: {args.metrics_json}\n")
+
+
+def run_command(parser, args):
     if args.command is None:
         parser.print_help()
     elif args.command == 'fetch':
+        from fetch_download_currencies import fetch_download_all_cryptocurrencies
+
         fetch_download_all_cryptocurrencies(
             args.interval,
+            fmt = args.format,
+            workers = args.workers,
+            requests_per_second = args.rate,
+            api_url = args.api_url,
+            resample_intervals = args.resample,
+            page_workers = args.page_workers,
+            resume = args.resume,
+            catalog_ttl_hours = args.catalog_ttl,
+            refresh_catalog = args.refresh_catalog,
+        )
+    elif args.command == 'resample':
+        from fetch_download_currencies import print_fetch_report
+        from resampler import resample_all
+
+        report = resample_all(
+            args.currency_pairs,
+            args.base_interval,
+            args.intervals,
+            rebuild = args.rebuild,
+            chunksize = args.chunksize,
         )
+        print_fetch_report(report, 'RESAMPLE REPORT')
+    elif args.command == 'migrate':
+        from data_manifest import build_manifest
+        from storage import migrate_directory
+
+        base_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', str(args.interval))
+        migrate_directory(
+            base_path,
+            args.format,
+            keep = args.keep,
+        )
+        build_manifest(base_path)
     elif args.command == 'analyze':
+        from consecutivedays_analyzer import consecutivedays_analyzer
+
         consecutivedays_analyzer(
             args.currency_pairs,
             args.price_tolerance,
@@ -58,8 +266,93 @@ def main():
             interval = args.interval,
             start_from = args.start_from,
             remove_lastdatapoints = args.remove_lastdatapoints,
+            output_dir = args.output_dir,
+            image_format = args.format,
+            workers = args.workers,
+            downsample = args.downsample,
+            chunksize = args.chunksize,
+            follow = args.follow,
+            replay = args.replay,
+            poll_seconds = args.poll_seconds,
+            api_url = args.api_url,
+            use_cache = args.use_cache,
+            cache_mb = args.cache_mb,
+            rule = args.rule,
         )
+    elif args.command == 'sweep':
+        from parameter_sweep import parameter_sweep, parse_grid
+
+        parameter_sweep(
+            args.currency_pairs,
+            parse_grid(args.price_tolerance),
+            parse_grid(args.volume_tolerance),
+            parse_grid(args.num_consecutive_days, cast=int),
+            interval = args.interval,
+            start_from = args.start_from,
+            remove_lastdatapoints = args.remove_lastdatapoints,
+            workers = args.workers,
+            top = args.top,
+            output = args.output,
+        )
+    elif args.command == 'walkforward':
+        from parameter_sweep import parse_grid
+        from walk_forward import walk_forward
+
+        walk_forward(
+            args.currency_pairs,
+            parse_grid(args.price_tolerance),
+            parse_grid(args.volume_tolerance),
+            parse_grid(args.num_consecutive_days, cast=int),
+            args.train,
+            args.test,
+            interval = args.interval,
+            start_from = args.start_from,
+            remove_lastdatapoints = args.remove_lastdatapoints,
+            anchored = args.anchored,
+            output = args.output,
+        )
+    elif args.command == 'screen':
+        from screener import screener
+
+        screener(
+            args.currency_pairs,
+            args.price_tolerance,
+            args.volume_tolerance,
+            num_consecutive_days = args.num_consecutive_days,
+            interval = args.interval,
+            start_from = args.start_from,
+            workers = args.workers,
+            output_format = args.format,
+            output = args.output,
+            show_all = args.all,
+            listed_only = args.listed_only,
+            rule = args.rule,
+        )
+    elif args.command == 'bench':
+        from benchmark import benchmark
+
+        regressions = benchmark(
+            num_pairs = args.pairs,
+            num_rows = args.rows,
+            interval = args.interval,
+            fmt = args.format,
+            seed = args.seed,
+            stages = args.stages,
+            repeat = args.repeat,
+            price_tolerance = args.price_tolerance,
+            volume_tolerance = args.volume_tolerance,
+            num_consecutive_days = args.num_consecutive_days,
+            data_dir = args.data_dir,
+            history = args.history,
+            baseline = args.baseline,
+            save_baseline = args.save_baseline,
+            threshold = args.threshold,
+        )
+        if regressions:
+            sys.exit(1)
     elif args.command == 'plot':
+        from parallel_plotter import parallel_plotter
+
         if args.currency_pairs == []:
             args.currency_pairs = True
 
@@ -71,6 +364,12 @@ def main():
             interval = args.interval,
             start_from_zero = args.start_from_zero,
             normalize_by_percentage_growth = args.normalize_by_percentage_growth,
+            output_dir = args.output_dir,
+            image_format = args.format,
+            downsample = args.downsample,
+            leaders_csv = args.leaders_csv,
+            gaps = args.gaps,
+            listed_only = args.listed_only,
         )
 
 
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+from defaults import GAP_MODES
+from storage import DEFAULT_CHUNKSIZE, iter_ohlcv_chunks, parse_ohlcv_filename
+
+
+class MarketPanel:
+    """
+    Dense time x pair matrices on a common time grid, one float64 array per metric.
+
+    Attributes:
+        times (np.ndarray): datetime64[s] grid, one row per interval.
+        pairs (list): currency pairs, one column each.
+        metrics (dict): metric name ('close', 'volume', ...) -> array of shape (len(times), len(pairs)).
+        listed (np.ndarray): bool array, True where a pair has a real candle at that time.
+    """
+    def __init__(self, times, pairs, metrics, listed):
+        self.times = times
+        self.pairs = pairs
+        self.metrics = metrics
+        self.listed = listed
+
+    def __getitem__(self, metric):
+        return self.metrics[metric]
+
+    def frame(self, values):
+        """
+        Wraps a (times x pairs) array in a DataFrame without copying it.
+        """
+        return pd.DataFrame(values, index=pd.DatetimeIndex(self.times, name='time'), columns=self.pairs, copy=False)
+
+
+def _forward_fill(values):
+    """
+    Forward-fills NaN down every column; leading NaN (before a pair is listed) stay NaN.
+    """
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = values[rows, np.arange(values.shape[1])]
+    first_valid = np.argmax(~np.isnan(values), axis=0)
+    filled[np.arange(len(values))[:, None] < first_valid] = np.nan
+    return filled
+
+
+def load_panel(files, start_date, end_date, interval, columns=('close',), gaps='nan', chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Loads data files into one MarketPanel on a regular grid between start_date and end_date.
+
+    Args:
+        files (list): data file paths; the pair name is taken from each file name.
+        start_date, end_date (str): 'YYYY-MM-DD-HH-MM' bounds, inclusive.
+        interval (int): grid step in seconds.
+        gaps (str): 'nan' leaves missing candles as NaN; 'ffill' carries the last close
+            (and the other metrics) forward once a pair is listed.
+        chunksize (int): rows read at a time, so only the window is ever held per pair.
+
+    Candles that do not fall on the grid are dropped.
+    """
+    if gaps not in GAP_MODES:
+        raise ValueError(f"gaps must be one of {GAP_MODES}")
+
+    start = int(pd.to_datetime(start_date, format='%Y-%m-%d-%H-%M').timestamp())
+    end = int(pd.to_datetime(end_date, format='%Y-%m-%d-%H-%M').timestamp())
+
+    # Read every pair in chunks, keeping only rows inside the window and stopping past end_date
+    windows = []
+    for file in files:
+        chunks = [arrays for first_row, arrays in iter_ohlcv_chunks(file, ['time', *columns], chunksize, start=start, end=end)]
+        window = {column: np.concatenate([np.asarray(arrays[column]) for arrays in chunks]) if chunks else np.empty(0) for column in ['time', *columns]}
+        windows.append((parse_ohlcv_filename(file)[0], window))
+
+    pairs = [pair for pair, window in windows]
+    non_empty = [window['time'] for pair, window in windows if len(window['time'])]
+    if not non_empty:
+        times = np.empty(0, dtype='datetime64[s]')
+        return MarketPanel(times, pairs, {column: np.empty((0, len(pairs))) for column in columns}, np.empty((0, len(pairs)), dtype=bool))
+
+    grid_start = min(int(window_times[0]) for window_times in non_empty)
+    grid_end = max(int(window_times[-1]) for window_times in non_empty)
+    num_rows = (grid_end - grid_start) // interval + 1
+
+    # One allocation per metric, filled column by column
+    metrics = {column: np.full((num_rows, len(pairs)), np.nan) for column in columns}
+    listed = np.zeros((num_rows, len(pairs)), dtype=bool)
+    for j, (pair, window) in enumerate(windows):
+        offsets = window['time'].astype(np.int64) - grid_start
+        on_grid = offsets % interval == 0
+        rows = offsets[on_grid] // interval
+        listed[rows, j] = True
+        for column in columns:
+            metrics[column][rows, j] = window[column][on_grid]
+
+    if gaps == 'ffill':
+        metrics = {column: _forward_fill(values) for column, values in metrics.items()}
+
+    times = (grid_start + np.arange(num_rows, dtype=np.int64) * interval).astype('datetime64[s]')
+    return MarketPanel(times, pairs, metrics, listed)
+
+
+def first_valid_values(values):
+    """
+    Returns the first non-NaN value of every column (NaN for empty columns).
+    """
+    first_valid = np.argmax(~np.isnan(values), axis=0)
+    return values[first_valid, np.arange(values.shape[1])] if len(values) else np.full(values.shape[1], np.nan)
+
+
+def normalize_panel(close, start_from_zero=False, normalize_by_percentage_growth=False):
+    """
+    Normalizes the close matrix for plotting: every column is normalized from its own first candle in the window.
+    """
+    if normalize_by_percentage_growth:
+        # Normalize by percentage growth
+        return (close / first_valid_values(close) - 1) * 100
+
+    # Normalize using min-max scaling
+    min_val = np.nanmin(close, axis=0)
+    max_val = np.nanmax(close, axis=0)
+    normalized = (close - min_val) / (max_val - min_val) * 100
+    if start_from_zero:
+        normalized -= first_valid_values(normalized)
+    return normalized
+
+
+def panel_growth_rates(panel):
+    """
+    Whole-matrix pct_change of close; like close.pct_change().fillna(0) per pair on its own
+    candles, and NaN where a pair has no candle so it cannot lead that interval.
+    """
+    close = _forward_fill(panel['close'])
+    growth = np.full(close.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth[1:] = close[1:] / close[:-1] - 1
+
+    # First candle of every pair (and any undefined ratio on a real candle) counts as 0 growth
+    growth = np.where(np.isnan(growth) & panel.listed, 0, growth)
+    growth[~panel.listed] = np.nan
+    return growth
@@ -1,11 +1,15 @@
 import argparse
-import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import datetime
 import os
-from matplotlib import cm
-import mplcursors
+
+from batch_render import save_figure, use_headless_backend, write_index
+from data_manifest import load_manifest, resolve_latest_files
+from downsample import axes_pixel_width, downsample_series
+from market_panel import load_panel, normalize_panel, panel_growth_rates
+from product_catalog import resolve_universe
+from profiling import profile_stage
 
 # Function to get all available currency pairs from the data directory
 def get_all_currency_pairs(abs_file_path, interval):
@@ -13,8 +17,8 @@ def get_all_currency_pairs(abs_file_path, interval):
     if not os.path.exists(base_path):
         print(f"The base path {base_path} does not exist.")
         return []
-    files = [f for f in os.listdir(base_path) if os.path.isfile(os.path.join(base_path, f))]
-    currency_pairs = list(set(f.split('_')[0] for f in files))
+    with profile_stage('discovery'):
+        currency_pairs = list(load_manifest(base_path)['pairs'])
     return currency_pairs
 
 
@@ -32,54 +36,79 @@ def get_latest_currency_pairs(currency_pairs, interval, abs_file_path):
         print(f"The base path {base_path} does not exist.")
         return path_file_names
 
-    # Iterate through each currency pair to find the latest file
-    for pair in currency_pairs:
-        # Initialize a flag to check if a matching file is found
-        found = False
-        # List all files in the base directory that matches the interval
-        files = [f for f in os.listdir(base_path) if os.path.isfile(os.path.join(base_path, f))]
-
-        # Filter and sort files by date for the current currency pair
-        sorted_files = sorted(
-            [file for file in files if file.startswith(pair + "_")],
-            key=lambda x: datetime.datetime.strptime(x.split('_')[-1], "%Y-%m-%d-%H-%M.csv"),
-            reverse=True
-        )
-
-        # If we find at least one file for the currency pair, add the full path of the latest file to the list
-        if sorted_files:
-            latest_file = sorted_files[0]
-            full_path = os.path.join(base_path, latest_file)
-            path_file_names.append(full_path)
-            found = True
-
-        if not found:
-            print(f"No files found for {pair} in {base_path}")
+    # Resolve the latest file of every pair through the data manifest instead of scanning the directory
+    with profile_stage('resolve'):
+        path_file_names = resolve_latest_files(currency_pairs, base_path)
 
     return path_file_names
 
-# Function to normalize the data
-def normalize_data(df, start_from_zero=False, normalize_by_percentage_growth=False):
-    if normalize_by_percentage_growth:
-        # Normalize by percentage growth
-        df['normalized_close'] = (df['close'] / df['close'].iloc[0] - 1) * 100
-    else:
-        # Normalize by range
-        min_val = df['close'].min()
-        max_val = df['close'].max()
-        df['normalized_close'] = (df['close'] - min_val) / (max_val - min_val) * 100
-        if start_from_zero:
-            df['normalized_close'] -= df['normalized_close'].iloc[0]
-    return df
-
-
-
-
-
-
-
-
 
+def leadership_timeline(growth_rates_df, interval):
+    """
+    Run-length encodes the strongest grower of every timestamp into (currency_pair, start, end, periods) rows.
+
+    A run ends when the leader changes or when the next timestamp is more than one interval away.
+    """
+    growth = growth_rates_df.dropna(how='all')
+    if growth.empty:
+        return pd.DataFrame(columns=['currency_pair', 'start', 'end', 'periods'])
+
+    # Same leader as idxmax(axis=1): NaN is skipped and ties go to the first column
+    values = growth.to_numpy(dtype=np.float64)
+    leaders = np.where(np.isnan(values), -np.inf, values).argmax(axis=1)
+
+    times = growth.index.to_numpy()
+    step = np.timedelta64(interval, 's')
+    new_run = np.ones(len(leaders), dtype=bool)
+    new_run[1:] = (leaders[1:] != leaders[:-1]) | (times[1:] - times[:-1] != step)
+
+    starts = np.flatnonzero(new_run)
+    ends = np.append(starts[1:], len(leaders)) - 1
+    return pd.DataFrame({
+        'currency_pair': growth.columns.to_numpy()[leaders[starts]],
+        'start': times[starts],
+        'end': times[ends] + step,
+        'periods': ends - starts + 1,
+    })
+
+
+def draw_leader_band(ax, timeline, currency_pairs, colors, y=-100):
+    """
+    Draws the strongest-grower band as a single LineCollection.
+
+    Every leading pair gets one polyline holding all its runs, separated by NaN
+    breaks, so the collection has one path per pair instead of one artist per timestamp.
+    """
+    import matplotlib.dates as mdates
+    from matplotlib.collections import LineCollection
+
+    if timeline.empty:
+        return None
+
+    # Pair -> color index lookup, built once instead of currency_pairs.index() per row
+    color_index = {pair: i for i, pair in enumerate(currency_pairs)}
+
+    leaders = timeline['currency_pair'].to_numpy()
+    x_start = mdates.date2num(timeline['start'].to_numpy())
+    x_end = mdates.date2num(timeline['end'].to_numpy())
+
+    segments = []
+    leading_pairs = pd.unique(leaders)
+    for pair in leading_pairs:
+        runs = leaders == pair
+        # start, end, NaN break for every run of this pair
+        xs = np.column_stack((x_start[runs], x_end[runs], np.full(runs.sum(), np.nan))).ravel()
+        ys = np.where(np.isnan(xs), np.nan, y)
+        segments.append(np.column_stack((xs, ys)))
+
+    band = LineCollection(
+        segments,
+        colors=colors([color_index[pair] for pair in leading_pairs]),
+        linewidths=[2.0 if pair == 'BTC-USD' else 6.0 for pair in leading_pairs],
+    )
+    ax.add_collection(band)
+    ax.autoscale_view()
+    return band
 
 
 def parallel_plotter(
@@ -89,6 +118,12 @@ def parallel_plotter(
         interval = 86400,  # 1 day in seconds
         start_from_zero = True,
         normalize_by_percentage_growth = True,
+        output_dir = None,
+        image_format = 'png',
+        downsample = True,
+        leaders_csv = None,
+        gaps = 'nan',
+        listed_only = False,
     ):
     # currency_pairs = [
     #     'DOGE-USD', 'SHIB-USD', 'BTC-USD', 'AIOZ-USD', 'AVAX-USD', 'AUCTION-USD', 
@@ -101,47 +136,73 @@ def parallel_plotter(
     # end_date = (datetime.datetime.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d') + '-00-00'
     
     
+    if output_dir:
+        use_headless_backend()
+
     script_directory = os.path.dirname(os.path.abspath(__file__))
     if currency_pairs == True:
         currency_pairs = get_all_currency_pairs(script_directory, interval)
+    # Leave out pairs the cached product catalog no longer lists, without asking the exchange
+    if listed_only:
+        currency_pairs = resolve_universe(currency_pairs)
 
 
     latest_files = get_latest_currency_pairs(currency_pairs, interval, script_directory)
-    normalized_data = {}
-    growth_rates = {}
-
-    for currency_pair, file in zip(currency_pairs, latest_files):
-        print(f"Loading data for {currency_pair} from {file}")
-        data = pd.read_csv(file, parse_dates=['time'])
-        start_dt = pd.to_datetime(start_date, format='%Y-%m-%d-%H-%M')
-        end_dt = pd.to_datetime(end_date, format='%Y-%m-%d-%H-%M')
-        data = data[(data['time'] >= start_dt) & (data['time'] <= end_dt)]
-        data['growth_rate'] = data['close'].pct_change().fillna(0)
-        normalized_data[currency_pair] = normalize_data(data, start_from_zero, normalize_by_percentage_growth)
-        growth_rates[currency_pair] = data.set_index('time')['growth_rate']
-
-    colors = cm.get_cmap('tab20', len(currency_pairs))
-    plt.figure(figsize=(14, 7))
-    lines = []
-    for i, currency_pair in enumerate(currency_pairs):
-        line, = plt.plot(normalized_data[currency_pair]['time'], normalized_data[currency_pair]['normalized_close'], label=currency_pair, color=colors(i), linewidth=2.0 if currency_pair == 'BTC-USD' else 1.0)
-        lines.append(line)
-
-    growth_rates_df = pd.DataFrame(growth_rates)
-    strongest_growth_intervals = growth_rates_df.idxmax(axis=1)
-    for time in strongest_growth_intervals.index:
-        strongest_currency = strongest_growth_intervals.loc[time]
-        color_index = currency_pairs.index(strongest_currency)
-        plt.hlines(y=-100, xmin=time, xmax=time + pd.Timedelta(seconds=interval), colors=colors(color_index), linewidth=2.0 if strongest_currency == 'BTC-USD' else 6.0)
-
-    plt.title('Normalized Cryptocurrency Prices')
-    plt.xlabel('Date')
-    plt.ylabel('Normalized Price (0 to 100)')
-    plt.legend()
-    plt.grid(True)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    for file in latest_files:
+        print(f"Loading data from {file}")
+
+    # One time x pair matrix per metric; pairs without a file are simply not columns
+    with profile_stage('load'):
+        panel = load_panel(latest_files, start_date, end_date, interval, columns=('close',), gaps=gaps)
+    currency_pairs = panel.pairs
+    with profile_stage('normalize'):
+        normalized_close = normalize_panel(panel['close'], start_from_zero, normalize_by_percentage_growth)
+        growth_rates = panel_growth_rates(panel)
+
+    with profile_stage('detect'):
+        timeline = leadership_timeline(panel.frame(growth_rates), interval)
+    if leaders_csv:
+        timeline.to_csv(leaders_csv, index=False)
+        print(f"\n This file is saved: {leaders_csv}\n")
+
+    with profile_stage('render'):
+        # Plotting libraries are only loaded once there is something to draw
+        import matplotlib.pyplot as plt
+
+        colors = plt.get_cmap('tab20', len(currency_pairs))
+        plt.figure(figsize=(14, 7))
+        lines = []
+        for i, currency_pair in enumerate(currency_pairs):
+            # Only the pair's own candles, so lines still join across missing intervals
+            present = ~np.isnan(normalized_close[:, i])
+            x, y = panel.times[present], normalized_close[present, i]
+            if downsample:
+                # Keep about one point per pixel of axes width
+                x, y = downsample_series(x, y, axes_pixel_width(plt.gca()))
+            line, = plt.plot(x, y, label=currency_pair, color=colors(i), linewidth=2.0 if currency_pair == 'BTC-USD' else 1.0)
+            lines.append(line)
+
+        draw_leader_band(plt.gca(), timeline, currency_pairs, colors)
+
+        plt.title('Normalized Cryptocurrency Prices')
+        plt.xlabel('Date')
+        plt.ylabel('Normalized Price (0 to 100)')
+        plt.legend()
+        plt.grid(True)
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+
+    if output_dir:
+        # Headless mode: save the chart and an index page instead of opening a window
+        os.makedirs(output_dir, exist_ok=True)
+        image = f'normalized_prices_{interval}.{image_format}'
+        with profile_stage('render'):
+            save_figure(plt.gcf(), os.path.join(output_dir, image))
+        write_index(output_dir, [{'image': image, 'caption': f'Normalized prices {start_date} to {end_date}'}], 'Normalized Cryptocurrency Prices')
+        return
     
+    import mplcursors
+
     cursor = mplcursors.cursor(lines, hover=True)
     cursor.connect("add", lambda sel: sel.annotation.set_text(sel.artist.get_label()))
     
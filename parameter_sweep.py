@@ -0,0 +1,156 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from consecutivedays_analyzer import get_latest_currency_pairs
+from profit_stats import compute_profit_stats
+from storage import parse_ohlcv_filename, read_ohlcv
+from streak_engine import build_pass_mask, build_price_series, find_streak_bounds
+
+
+
+
+
+
+# Row layout of the shared block: one float64 row per series
+SHARED_SERIES = ('price', 'volume', 'close')
+
+# Set in every worker by _attach_shared_series
+_shared_block = None
+_shared_series = None
+
+
+def parse_grid(values, cast=float):
+  """
+  Expands grid tokens into a sorted list of values.
+
+  Each token is either a single value ('0.01') or an inclusive range written
+  as 'start:stop:step' ('0.005:0.05:0.005').
+  """
+  grid = set()
+  for token in values:
+    token = str(token)
+    if ':' in token:
+      start, stop, step = (float(part) for part in token.split(':'))
+      if step <= 0:
+        raise ValueError(f"Step must be positive in grid range '{token}'")
+      count = int(np.floor((stop - start) / step + 1e-9)) + 1
+      grid.update(cast(round(start + k * step, 12)) for k in range(count))
+    else:
+      grid.add(cast(token))
+  return sorted(grid)
+
+
+def _attach_shared_series(name, num_rows):
+  global _shared_block, _shared_series
+
+  _shared_block = shared_memory.SharedMemory(name=name)
+  _shared_series = np.ndarray((len(SHARED_SERIES), num_rows), dtype=np.float64, buffer=_shared_block.buf)
+
+
+def _evaluate_tolerances(task):
+  """
+  Evaluates every num_consecutive_days candidate for one (price, volume) tolerance pair,
+  so the pass mask is built once per task.
+  """
+  price_tolerance, volume_tolerance, num_consecutive_days_grid = task
+  price, volume, close = _shared_series
+
+  mask = build_pass_mask(price, volume, price_tolerance, volume_tolerance)
+
+  results = []
+  for num_consecutive_days in num_consecutive_days_grid:
+    entries, exits = find_streak_bounds(mask, num_consecutive_days)
+    consecutive_days = np.column_stack((entries, exits, np.zeros_like(entries)))
+    stats = compute_profit_stats(close, consecutive_days, len(close))
+    results.append({
+      'price_tolerance': price_tolerance,
+      'volume_tolerance': volume_tolerance,
+      'num_consecutive_days': num_consecutive_days,
+      'cagr': stats['cagr'],
+      'total_return': stats['total_return'],
+      'trades': stats['trades'],
+    })
+  return results
+
+
+def sweep_dataframe(df, price_tolerances, volume_tolerances, num_consecutive_days_grid, workers=None):
+  """
+  Evaluates the full parameter grid over one pair's OHLCV and returns a DataFrame ranked by CAGR.
+
+  The price, volume and close series are copied once into shared memory; worker
+  processes attach to that block instead of receiving the arrays with every task.
+  """
+  num_rows = len(df)
+  columns = ['price_tolerance', 'volume_tolerance', 'num_consecutive_days', 'cagr', 'total_return', 'trades']
+  if num_rows == 0:
+    return pd.DataFrame(columns=columns)
+
+  block = shared_memory.SharedMemory(create=True, size=len(SHARED_SERIES) * num_rows * 8)
+  try:
+    series = np.ndarray((len(SHARED_SERIES), num_rows), dtype=np.float64, buffer=block.buf)
+    series[0] = build_price_series(df['open'].to_numpy(), df['close'].to_numpy())
+    series[1] = df['volume'].to_numpy(dtype=np.float64)
+    series[2] = df['close'].to_numpy(dtype=np.float64)
+
+    tasks = [(p, v, list(num_consecutive_days_grid)) for p, v in itertools.product(price_tolerances, volume_tolerances)]
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (4 * workers))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared_series, initargs=(block.name, num_rows)) as executor:
+      for task_results in executor.map(_evaluate_tolerances, tasks, chunksize=chunksize):
+        results.extend(task_results)
+    del series
+  finally:
+    block.close()
+    block.unlink()
+
+  ranking = pd.DataFrame(results, columns=columns)
+  return ranking.sort_values(['cagr', 'total_return'], ascending=False, na_position='last').reset_index(drop=True)
+
+
+def parameter_sweep(
+    currency_pairs,
+    price_tolerances,
+    volume_tolerances,
+    num_consecutive_days_grid,
+    interval = 86400,
+    start_from = 0,
+    remove_lastdatapoints = 0,
+    workers = None,
+    top = 20,
+    output = None,
+):
+  script_directory = os.path.dirname(os.path.abspath(__file__))
+
+  latest_selected_files = get_latest_currency_pairs(currency_pairs, interval, script_directory)
+
+  combinations = len(price_tolerances) * len(volume_tolerances) * len(num_consecutive_days_grid)
+  print(f"Sweeping {combinations} parameter combinations per pair")
+
+  rankings = []
+  for selected_file in latest_selected_files:
+    df = read_ohlcv(selected_file, columns=['open', 'close', 'volume'])
+    df = df[start_from:len(df)-remove_lastdatapoints]
+
+    ranking = sweep_dataframe(df, price_tolerances, volume_tolerances, num_consecutive_days_grid, workers)
+    ranking.insert(0, 'currency_pair', parse_ohlcv_filename(selected_file)[0])
+    rankings.append(ranking)
+
+    print(f"\nBest parameters for {selected_file} ({len(df)} rows):")
+    print(ranking.head(top).to_string(index=False))
+
+  if not rankings:
+    return pd.DataFrame()
+
+  all_rankings = pd.concat(rankings, ignore_index=True)
+  if output:
+    all_rankings.to_csv(output, index=False)
+    print(f"\n This file is saved: {output}\n")
+  return all_rankings
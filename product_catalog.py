@@ -0,0 +1,128 @@
+import datetime
+import json
+import os
+import time
+
+from defaults import DEFAULT_CATALOG_TTL_HOURS
+
+
+
+
+
+
+# Shared by every interval, next to the data/{interval}/ directories
+CATALOG_NAME = 'products.json'
+
+# Listing changes kept in the catalog, newest last
+MAX_CATALOG_CHANGES = 100
+
+
+def default_catalog_path():
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', CATALOG_NAME)
+
+
+def load_catalog(path=None):
+  """
+  Returns the cached product catalog, or None if there is none yet.
+  """
+  try:
+    with open(path or default_catalog_path()) as catalog_file:
+      return json.load(catalog_file)
+  except (OSError, ValueError):
+    return None
+
+
+def save_catalog(catalog, path=None):
+  """
+  Writes the catalog atomically (temp file then rename), like the data manifest.
+  """
+  path = path or default_catalog_path()
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp_path = f'{path}.tmp'
+  with open(tmp_path, 'w') as catalog_file:
+    json.dump(catalog, catalog_file, indent=1, sort_keys=True)
+  os.replace(tmp_path, path)
+
+
+def listed_pairs(catalog):
+  """
+  Returns the sorted ids of the pairs that are online in the catalog.
+  """
+  return sorted(pair for pair, product in catalog['products'].items() if product['status'] == 'online')
+
+
+def catalog_diff(previous, products):
+  """
+  Compares the online pairs of the previous catalog (or None) with a new product dict.
+  """
+  before = set(listed_pairs(previous)) if previous else set()
+  after = {pair for pair, product in products.items() if product['status'] == 'online'}
+  return {'listed': sorted(after - before), 'delisted': sorted(before - after)}
+
+
+def catalog_age_hours(catalog):
+  return (time.time() - catalog['updated']) / 3600
+
+
+def refresh_catalog(client, ttl_hours=DEFAULT_CATALOG_TTL_HOURS, refresh=False, path=None):
+  """
+  Returns the product catalog, requesting the exchange's product list only when the cache is stale.
+
+  A fresh cache (younger than ttl_hours, unless refresh) is returned without
+  any network access. On a refresh the online pairs are compared with the
+  cached ones, and the listed and delisted pairs are stored with the catalog
+  as its latest change. If the exchange cannot be reached the stale cache is
+  used; only without any cache does the error propagate.
+  """
+  from candles_client import CandlesRequestError
+
+  previous = load_catalog(path)
+  if previous is not None and not refresh and catalog_age_hours(previous) < ttl_hours:
+    return previous
+
+  try:
+    products = {
+      product['id']: {key: product.get(key) for key in ('status', 'base_currency', 'quote_currency')}
+      for product in client.get_products()
+    }
+  except CandlesRequestError as error:
+    if previous is None:
+      raise
+    print(f"\n Product list unavailable ({error}); using the catalog of {previous['updated_at']}\n\n")
+    return previous
+
+  diff = catalog_diff(previous, products)
+  if previous is not None and (diff['listed'] or diff['delisted']):
+    print(f"Product catalog changes: listed {', '.join(diff['listed']) or 'none'}; delisted {', '.join(diff['delisted']) or 'none'}")
+  updated = time.time()
+  changes = previous.get('changes', []) if previous else []
+  if previous is None or diff['listed'] or diff['delisted']:
+    changes = (changes + [{'time': int(updated), **diff}])[-MAX_CATALOG_CHANGES:]
+
+  catalog = {
+    'updated': updated,
+    'updated_at': datetime.datetime.fromtimestamp(updated, datetime.timezone.utc).isoformat(timespec='seconds'),
+    'products': products,
+    'changes': changes,
+    'last_diff': diff,
+  }
+  save_catalog(catalog, path)
+  return catalog
+
+
+def resolve_universe(currency_pairs=None, path=None):
+  """
+  Offline pair universe for the analysis tools: the given pairs minus the ones the
+  cached catalog knows as no longer online, or every listed pair when none are given.
+
+  Returns currency_pairs unchanged when there is no cached catalog yet.
+  """
+  catalog = load_catalog(path)
+  if catalog is None:
+    print("No product catalog cached yet; run fetch once to build it")
+    return currency_pairs
+  listed = listed_pairs(catalog)
+  if currency_pairs is None:
+    return listed
+  listed = set(listed)
+  return [pair for pair in currency_pairs if pair in listed]
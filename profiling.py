@@ -0,0 +1,139 @@
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+
+
+
+
+
+# Stage names used across the commands, in pipeline order
+PROFILE_STAGES = ['discovery', 'resolve', 'cache', 'network', 'load', 'filter', 'detect', 'profit', 'normalize', 'write', 'resample', 'render']
+
+
+class StageProfiler:
+  """
+  Wall-clock time per stage, aggregated per currency pair and over the whole run.
+
+  Disabled by default: stage() then does nothing but one flag check, so the
+  instrumented code paths cost nothing in normal runs. Safe to use from the
+  fetch worker threads; timings taken inside worker processes (render, sweep
+  and screen pools) stay in those processes, so pools are timed as a whole.
+  """
+  def __init__(self):
+    self.enabled = False
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    self.started = time.perf_counter()
+    self.stages = {}
+    self.pairs = {}
+
+  @contextlib.contextmanager
+  def stage(self, name, currency_pair=None):
+    if not self.enabled:
+      yield
+      return
+    started = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add(name, time.perf_counter() - started, currency_pair)
+
+  def timed_iter(self, iterable, name, currency_pair=None):
+    """
+    Yields from iterable, timing every next() as the given stage (e.g. chunked reads).
+    """
+    iterator = iter(iterable)
+    while True:
+      with self.stage(name, currency_pair):
+        try:
+          item = next(iterator)
+        except StopIteration:
+          return
+      yield item
+
+  def add(self, name, seconds, currency_pair=None):
+    with self._lock:
+      totals = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+      totals['calls'] += 1
+      totals['seconds'] += seconds
+      if currency_pair is not None:
+        pair_stages = self.pairs.setdefault(currency_pair, {})
+        pair_stages[name] = pair_stages.get(name, 0.0) + seconds
+
+  def metrics(self, command=None, argv=None):
+    """
+    Returns the run as a JSON-ready dict: total seconds, per-stage totals and per-pair stage seconds.
+    """
+    return {
+      'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+      'command': command,
+      'argv': argv,
+      'seconds': time.perf_counter() - self.started,
+      'stages': self.stages,
+      'pairs': self.pairs,
+    }
+
+  def print_report(self, top=10):
+    """
+    Prints the stage totals of the run and the top slowest pairs.
+    """
+    run_seconds = time.perf_counter() - self.started
+    print('#####################################################')
+    print('################  PROFILE  ##########################')
+    print('#####################################################')
+    print(f"{'stage':<12}{'calls':>8}{'seconds':>12}{'mean ms':>12}{'% of run':>10}")
+    order = {name: i for i, name in enumerate(PROFILE_STAGES)}
+    for name, totals in sorted(self.stages.items(), key=lambda item: (order.get(item[0], len(order)), item[0])):
+      print(f"{name:<12}{totals['calls']:>8}{totals['seconds']:>12.3f}{totals['seconds'] / totals['calls'] * 1000:>12.2f}{totals['seconds'] / run_seconds * 100:>10.1f}")
+    print(f"{'run':<12}{'':>8}{run_seconds:>12.3f}")
+
+    slowest = sorted(self.pairs.items(), key=lambda item: sum(item[1].values()), reverse=True)[:top]
+    if slowest:
+      print(f"\nSlowest {len(slowest)} of {len(self.pairs)} pairs:")
+      for currency_pair, pair_stages in slowest:
+        breakdown = ', '.join(f"{name} {seconds:.3f}s" for name, seconds in sorted(pair_stages.items(), key=lambda item: -item[1]))
+        print(f"{currency_pair}: {sum(pair_stages.values()):.3f}s ({breakdown})")
+
+
+# One profiler per process, switched on by main.py --profile / --metrics-json
+profiler = StageProfiler()
+
+
+def profile_stage(name, currency_pair=None):
+  """
+  Context manager timing a block as the given stage, optionally for one currency pair.
+  """
+  return profiler.stage(name, currency_pair)
+
+
+def load_json_file(path, default):
+  try:
+    with open(path) as json_file:
+      return json.load(json_file)
+  except (OSError, ValueError):
+    return default
+
+
+def save_json_file(path, data):
+  """
+  Writes data as JSON through a temp file and a rename, like the data manifest.
+  """
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+  with open(f'{path}.tmp', 'w') as json_file:
+    json.dump(data, json_file, indent=1)
+  os.replace(f'{path}.tmp', path)
+
+
+def append_metrics(path, record):
+  """
+  Appends one run record to the JSON list in path, so daily runs build a history.
+  """
+  records = load_json_file(path, [])
+  records.append(record)
+  save_json_file(path, records)
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+
+
+
+
+
+SECONDS_PER_YEAR = 365 * 86400
+
+
+def years_of_rows(num_rows, interval=86400):
+  """
+  Years covered by num_rows candles of interval seconds; NaN for an empty slice.
+  """
+  return num_rows * interval / SECONDS_PER_YEAR if num_rows else np.nan
+
+
+def compute_profit_stats(close, consecutive_days, num_rows, investment_amount=100, interval=86400):
+  """
+  Computes the statistics printed by calculate_profits without printing anything.
+
+  Args:
+      close (array): close prices of the analysed slice, indexed by position.
+      consecutive_days (list): [start, end, counter] positions from find_consecutive_days.
+      num_rows (int): number of rows in the analysed slice, used for the yearly figures.
+      investment_amount (float): starting balance.
+      interval (int): candle interval in seconds, so num_rows can be turned into years.
+  """
+  close = np.asarray(close, dtype=np.float64)
+  positions = np.asarray(consecutive_days, dtype=np.int64).reshape(-1, 3)
+
+  entry_prices = close[positions[:, 0]]
+  exit_prices = close[positions[:, 1]]
+  profit_percents = (exit_prices - entry_prices) / entry_prices
+
+  # Compound sequentially from the starting balance, same order as the original loop
+  balances = np.cumprod(np.concatenate(([investment_amount], 1 + profit_percents)))[1:]
+  balance = balances[-1] if len(balances) else investment_amount
+
+  years = years_of_rows(num_rows, interval)
+  total_return = balance - investment_amount
+
+  return {
+    'profits': profit_percents * 100,
+    'balances': balances,
+    'balance': balance,
+    'total_return': total_return,
+    'average_yearly_return': total_return / years,
+    'cagr': ((balance / investment_amount) ** (1 / years) - 1) * 100,
+    'years': years,
+    'trades': len(positions),
+  }
@@ -0,0 +1,185 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_manifest import load_manifest, record_data_file
+from result_cache import ResultCache
+from storage import DEFAULT_CHUNKSIZE, OHLCV_COLUMNS, append_parts, iter_ohlcv_chunks, ohlcv_filename, read_ohlcv_arrays, remove_ohlcv, storage_format, write_ohlcv
+
+
+
+
+
+
+
+def check_intervals(base_interval, interval):
+  """
+  Raises ValueError unless interval is a coarser whole multiple of base_interval.
+  """
+  if interval <= base_interval or interval % base_interval:
+    raise ValueError(f"Cannot resample {base_interval}s candles to {interval}s: the target must be a larger multiple of the base interval")
+
+
+def resample_bars(arrays, interval):
+  """
+  Aggregates time-sorted candles into interval bars with one reduceat per column.
+
+  Bars start at multiples of interval in epoch seconds (UTC midnight for 86400),
+  like the exchange's own candles: first open, max high, min low, last close and
+  summed volume. Empty buckets produce no bar.
+
+  Args:
+      arrays (dict): 'time' (int64 epoch seconds), 'low', 'high', 'open', 'close', 'volume' arrays.
+  """
+  times = np.asarray(arrays['time'], dtype=np.int64)
+  if not len(times):
+    return {column: np.empty(0, dtype=np.int64 if column == 'time' else np.float64) for column in OHLCV_COLUMNS}
+
+  buckets = times - times % interval
+  starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+  ends = np.append(starts[1:], len(times)) - 1
+
+  return {
+    'time': buckets[starts],
+    'low': np.fmin.reduceat(np.asarray(arrays['low'], dtype=np.float64), starts),
+    'high': np.fmax.reduceat(np.asarray(arrays['high'], dtype=np.float64), starts),
+    'open': np.asarray(arrays['open'], dtype=np.float64)[starts],
+    'close': np.asarray(arrays['close'], dtype=np.float64)[ends],
+    'volume': np.add.reduceat(np.asarray(arrays['volume'], dtype=np.float64), starts),
+  }
+
+
+def combine_bars(parts):
+  """
+  Concatenates bar dicts in time order, merging the bar split across two parts (e.g. two chunks).
+
+  The last bar of a part may be updated in place.
+  """
+  merged = []
+  for part in parts:
+    if merged and len(part['time']) and merged[-1]['time'][-1] == part['time'][0]:
+      # Same bar on both sides of a chunk boundary
+      last = merged[-1]
+      last['low'][-1] = np.fmin(last['low'][-1], part['low'][0])
+      last['high'][-1] = np.fmax(last['high'][-1], part['high'][0])
+      last['close'][-1] = part['close'][0]
+      last['volume'][-1] += part['volume'][0]
+      part = {column: values[1:] for column, values in part.items()}
+    if len(part['time']):
+      merged.append(part)
+
+  if not merged:
+    return resample_bars({'time': []}, 1)
+  return {column: np.concatenate([part[column] for part in merged]) for column in OHLCV_COLUMNS}
+
+
+def resample_file(path, interval, start=None, chunksize=DEFAULT_CHUNKSIZE):
+  """
+  Resamples a data file chunk by chunk, from the optional start epoch on.
+  """
+  parts = [
+    resample_bars(arrays, interval)
+    for first_row, arrays in iter_ohlcv_chunks(path, OHLCV_COLUMNS, chunksize, start=start)
+  ]
+  return combine_bars(parts)
+
+
+def resample_currency_pair(currency_pair, base_interval, interval, script_directory, rebuild=False, chunksize=DEFAULT_CHUNKSIZE):
+  """
+  Builds or updates data/{interval}/ for one currency pair from its data/{base_interval}/ file.
+
+  An existing resampled file is updated incrementally: only base candles from its
+  last bar on are read, since that bar may have been incomplete, and the bars
+  before it are kept; a .parts file only takes the new bars, like a fetch append.
+  A target file fetched from the exchange is left alone unless rebuild, so
+  exchange and derived candles never end up in one file. Returns a short
+  status for the report.
+  """
+  check_intervals(base_interval, interval)
+  source_base = f"{script_directory}/data/{base_interval}"
+  target_base = f"{script_directory}/data/{interval}"
+  os.makedirs(target_base, exist_ok=True)
+
+  source = load_manifest(source_base)['pairs'].get(currency_pair)
+  if source is None or not source['rows']:
+    return 'no data'
+  source_path = os.path.join(source_base, source['file'])
+
+  target = load_manifest(target_base)['pairs'].get(currency_pair)
+  previous_path = os.path.join(target_base, target['file']) if target is not None else None
+  if previous_path is not None and not os.path.exists(previous_path):
+    target, previous_path = None, None
+
+  if target is not None and not rebuild and 'source_last_time' not in target:
+    # Only the resampler records source_last_time; this file holds the exchange's own candles
+    print(f"\n {previous_path} was fetched from the exchange; resample with --rebuild to replace it\n\n")
+    return 'skipped: fetched file, use --rebuild'
+
+  if target is not None and not rebuild and target.get('source_last_time') == source['last_time']:
+    # No base candle arrived since this pair was last resampled
+    return 'up to date'
+
+  incremental = target is not None and target['rows'] and not rebuild
+  if incremental and storage_format(previous_path) == 'parts':
+    # Partitioned files take the new bars in place; the bar at last_time is replaced by its recomputed value
+    bars = resample_file(source_path, interval, start=target['last_time'], chunksize=chunksize)
+    if not len(bars['time']):
+      return 'no data'
+    data = pd.DataFrame({column: bars[column] for column in OHLCV_COLUMNS})
+    data['time'] = pd.to_datetime(data['time'], unit='s')
+    filename = f"{target_base}/{ohlcv_filename(currency_pair, interval, data['time'].iloc[-1], 'parts')}"
+    append_parts(previous_path, data, filename)
+    record_data_file(target_base, currency_pair, filename, source_last_time=source['last_time'])
+    ResultCache().invalidate(currency_pair, interval)
+    print(f"\n This file is saved: {filename}\n\n")
+    return 'updated'
+
+  if not incremental:
+    bars = resample_file(source_path, interval, chunksize=chunksize)
+  else:
+    previous = read_ohlcv_arrays(previous_path, mmap=False)
+    keep = np.asarray(previous['time']) < target['last_time']
+    kept = {column: np.asarray(previous[column])[keep] for column in OHLCV_COLUMNS}
+    bars = combine_bars([kept, resample_file(source_path, interval, start=target['last_time'], chunksize=chunksize)])
+
+  if not len(bars['time']):
+    return 'no data'
+
+  data = pd.DataFrame({column: bars[column] for column in OHLCV_COLUMNS})
+  data['time'] = pd.to_datetime(data['time'], unit='s')
+
+  fmt = storage_format(previous_path or source_path)
+  filename = f"{target_base}/{ohlcv_filename(currency_pair, interval, data['time'].iloc[-1], fmt)}"
+  write_ohlcv(data, filename)
+  record_data_file(target_base, currency_pair, filename, bars['time'], source_last_time=source['last_time'])
+  if previous_path and os.path.abspath(previous_path) != os.path.abspath(filename):
+    remove_ohlcv(previous_path)
+  ResultCache().invalidate(currency_pair, interval)
+
+  print(f"\n This file is saved: {filename}\n\n")
+  return 'updated' if incremental else 'resampled'
+
+
+def resample_all(currency_pairs, base_interval, intervals, rebuild=False, chunksize=DEFAULT_CHUNKSIZE):
+  """
+  Resamples every currency pair (all pairs of data/{base_interval}/ when None) to each interval.
+
+  Returns a {'PAIR@interval': status} report.
+  """
+  script_directory = os.path.dirname(os.path.abspath(__file__))
+  for interval in intervals:
+    check_intervals(base_interval, interval)
+
+  if not currency_pairs:
+    currency_pairs = list(load_manifest(f"{script_directory}/data/{base_interval}")['pairs'])
+
+  report = {}
+  for interval in intervals:
+    for currency_pair in currency_pairs:
+      try:
+        report[f'{currency_pair}@{interval}'] = resample_currency_pair(currency_pair, base_interval, interval, script_directory, rebuild, chunksize)
+      except Exception as error:
+        print(f"\n Failed to resample {currency_pair} to {interval}: {error}\n\n")
+        report[f'{currency_pair}@{interval}'] = f'failed: {error}'
+  return report
@@ -0,0 +1,159 @@
+import contextlib
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from data_manifest import load_manifest
+from defaults import DEFAULT_CACHE_MB
+from storage import parse_ohlcv_filename, write_marker_path
+
+
+
+
+
+
+# Bumped whenever what is stored (or how it is computed) changes, so old entries are never read
+CACHE_VERSION = 1
+
+# Profit statistics stored as arrays; the other statistics are scalars kept as JSON
+STATS_ARRAYS = ['profits', 'balances']
+
+
+def default_cache_dir():
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'analysis')
+
+
+def data_fingerprint(selected_file):
+  """
+  Identifies the current content of a data file without reading it.
+
+  Combines the pair's manifest entry (file, rows, first/last time) with the
+  size and modification time of the file, or of the part of a data directory
+  that is rewritten with every write.
+  """
+  base_path = os.path.dirname(selected_file.rstrip('/'))
+  currency_pair = parse_ohlcv_filename(selected_file)[0]
+  stat = os.stat(write_marker_path(selected_file))
+  return {
+    'file': os.path.basename(selected_file.rstrip('/')),
+    'entry': load_manifest(base_path)['pairs'].get(currency_pair),
+    'size': stat.st_size,
+    'mtime_ns': stat.st_mtime_ns,
+  }
+
+
+def analysis_key(selected_file, parameters):
+  """
+  Cache key of one analysis: the data fingerprint plus every parameter that changes the result.
+  """
+  payload = json.dumps([CACHE_VERSION, data_fingerprint(selected_file), list(parameters)], sort_keys=True, default=str)
+  return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class ResultCache:
+  """
+  Size-bounded on-disk cache of analysis results, one .npz file per entry.
+
+  Entries are named '{pair}_{interval}_{key}.npz'. Every hit touches the file,
+  so its modification time doubles as the LRU clock and no shared index has to
+  be kept in sync between the render workers. When a put takes the directory
+  over max_mb, the least recently used entries are removed.
+  """
+  def __init__(self, cache_dir=None, max_mb=DEFAULT_CACHE_MB):
+    self.cache_dir = cache_dir or default_cache_dir()
+    self.max_bytes = int(max_mb * 2**20)
+
+  def _path(self, selected_file, key):
+    currency_pair, interval = parse_ohlcv_filename(selected_file)[:2]
+    return os.path.join(self.cache_dir, f'{currency_pair}_{interval}_{key}.npz')
+
+  def get(self, selected_file, key):
+    """
+    Returns the cached (df_dates, consecutive_days, stats), or None on a miss.
+
+    Another process may evict the entry at any point; an entry that vanished
+    while it was read counts as a miss.
+    """
+    path = self._path(selected_file, key)
+    try:
+      with np.load(path) as entry:
+        df_dates = pd.DataFrame(
+          {'close': entry['close'], 'volume': entry['volume']},
+          index=pd.DatetimeIndex(entry['time'], name='time'),
+        )
+        consecutive_days = entry['positions'].tolist()
+        stats = json.loads(str(entry['stats']))
+        for name in STATS_ARRAYS:
+          stats[name] = entry[name]
+    except FileNotFoundError:
+      return None
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+      # A half-written or outdated entry is simply recomputed
+      with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+      return None
+
+    try:
+      os.utime(path)
+    except FileNotFoundError:
+      return None
+    return df_dates, consecutive_days, stats
+
+  def put(self, selected_file, key, df_dates, consecutive_days, stats):
+    path = self._path(selected_file, key)
+    os.makedirs(self.cache_dir, exist_ok=True)
+
+    scalars = {name: value.item() if isinstance(value, np.generic) else value for name, value in stats.items() if name not in STATS_ARRAYS}
+    # Temp file then rename, so a reader never sees a partial entry
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as entry_file:
+      np.savez(
+        entry_file,
+        time=df_dates.index.to_numpy(),
+        close=df_dates['close'].to_numpy(),
+        volume=df_dates['volume'].to_numpy(),
+        positions=np.asarray(consecutive_days, dtype=np.int64).reshape(-1, 3),
+        stats=np.array(json.dumps(scalars)),
+        **{name: np.asarray(stats[name]) for name in STATS_ARRAYS},
+      )
+    os.replace(tmp_path, path)
+    self.evict()
+
+  def evict(self):
+    """
+    Removes the least recently used entries until the cache fits in max_bytes.
+    """
+    entries = []
+    for entry in os.scandir(self.cache_dir):
+      if entry.name.endswith('.npz'):
+        with contextlib.suppress(FileNotFoundError):
+          stat = entry.stat()
+          entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      total -= size
+
+  def invalidate(self, currency_pair, interval):
+    """
+    Removes every entry of one pair and interval, e.g. after the fetcher updated its data file.
+    """
+    if not os.path.isdir(self.cache_dir):
+      return
+    prefix = f'{currency_pair}_{interval}_'
+    for entry in os.scandir(self.cache_dir):
+      if entry.name.startswith(prefix) and entry.name.endswith('.npz'):
+        try:
+          os.remove(entry.path)
+        except FileNotFoundError:
+          pass
@@ -0,0 +1,163 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_manifest import load_manifest, resolve_latest_files
+from defaults import SCREEN_FORMATS
+from product_catalog import resolve_universe
+from profit_stats import compute_profit_stats
+from signal_rules import RuleStreakDetector, compile_rule
+from storage import format_epoch, parse_ohlcv_filename, read_ohlcv_arrays
+from streak_engine import StreakDetector
+
+
+
+
+
+
+
+SCREEN_COLUMNS = [
+  'currency_pair', 'signal', 'streak', 'entry_time', 'entry_price', 'last_time', 'last_close',
+  'open_return', 'trades', 'cagr', 'total_return', 'rows',
+]
+
+def screen_file(task):
+  """
+  Runs the detector over one data file and returns its current streak, open position and CAGR.
+
+  'signal' is 'open' while a position is held (the streak reached num_consecutive_days
+  and has not broken yet), 'building' while a streak is shorter than that and 'none'
+  right after a failing candle. With a rule, its mask replaces the close and volume comparison.
+  """
+  selected_file, price_tolerance, volume_tolerance, num_consecutive_days, start_from, rule = task
+  if rule is not None:
+    detector = RuleStreakDetector(compile_rule(rule), price_tolerance, volume_tolerance, num_consecutive_days)
+  else:
+    detector = StreakDetector(price_tolerance, volume_tolerance, num_consecutive_days)
+
+  columns = ['time', 'close'] + [column for column in detector.columns if column != 'close']
+  arrays = read_ohlcv_arrays(selected_file, columns=columns)
+  arrays = {column: np.asarray(values[start_from:]) for column, values in arrays.items()}
+  num_rows = len(arrays['time'])
+  currency_pair, interval = parse_ohlcv_filename(selected_file)[:2]
+
+  entries, exits = detector.feed_columns(arrays)
+  positions = np.column_stack((entries, exits, np.zeros_like(entries)))
+  stats = compute_profit_stats(arrays['close'], positions, num_rows, interval=interval)
+
+  result = {
+    'currency_pair': currency_pair,
+    'signal': 'none',
+    'streak': detector.counter if num_rows > 1 else 0,
+    'entry_time': None,
+    'entry_price': None,
+    'last_time': format_epoch(arrays['time'][-1], '%Y-%m-%d %H:%M') if num_rows else None,
+    'last_close': float(arrays['close'][-1]) if num_rows else None,
+    'open_return': None,
+    'trades': stats['trades'],
+    'cagr': float(stats['cagr']),
+    'total_return': float(stats['total_return']),
+    'rows': num_rows,
+  }
+
+  if detector.entry is not None:
+    entry_price = float(arrays['close'][detector.entry])
+    result.update({
+      'signal': 'open',
+      'entry_time': format_epoch(arrays['time'][detector.entry], '%Y-%m-%d %H:%M'),
+      'entry_price': entry_price,
+      'open_return': (result['last_close'] - entry_price) / entry_price * 100,
+    })
+  elif result['streak'] > 0:
+    result['signal'] = 'building'
+  return result
+
+
+def screen_files(latest_selected_files, price_tolerance, volume_tolerance, num_consecutive_days=3, start_from=0, workers=None, rule=None):
+  """
+  Screens every data file in a process pool and returns a DataFrame sorted by signal, streak and CAGR.
+  """
+  tasks = [(selected_file, price_tolerance, volume_tolerance, num_consecutive_days, start_from, rule) for selected_file in latest_selected_files]
+  if not tasks:
+    return pd.DataFrame(columns=SCREEN_COLUMNS)
+
+  workers = workers or os.cpu_count() or 1
+  chunksize = max(1, len(tasks) // (4 * workers))
+
+  results = []
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    for result in executor.map(_screen_reported, tasks, chunksize=chunksize):
+      if result is not None:
+        results.append(result)
+
+  screen = pd.DataFrame(results, columns=SCREEN_COLUMNS)
+  screen['signal_rank'] = screen['signal'].map({'open': 0, 'building': 1, 'none': 2})
+  screen = screen.sort_values(['signal_rank', 'streak', 'cagr'], ascending=[True, False, False], na_position='last')
+  return screen.drop(columns='signal_rank').reset_index(drop=True)
+
+
+def _screen_reported(task):
+  try:
+    return screen_file(task)
+  except Exception as error:
+    print(f"Failed to screen {task[0]}: {error}")
+    return None
+
+
+def screener(
+    currency_pairs,
+    price_tolerance,
+    volume_tolerance,
+    num_consecutive_days = 3,
+    interval = 86400,
+    start_from = 0,
+    workers = None,
+    output_format = 'table',
+    output = None,
+    show_all = False,
+    listed_only = False,
+    rule = None,
+):
+  """
+  Screens every pair in data/{interval}/ (or the given pairs) for active streaks.
+
+  Prints (or writes to output) a table or JSON of the pairs with an active streak,
+  or of every pair with show_all. With listed_only, pairs the cached product catalog
+  no longer lists are left out. rule is the text of a signal rule (see signal_rules).
+  """
+  script_directory = os.path.dirname(os.path.abspath(__file__))
+  base_path = f'{script_directory}/data/{interval}/'
+  if not os.path.exists(base_path):
+    print(f"The base path {base_path} does not exist.")
+    return pd.DataFrame(columns=SCREEN_COLUMNS)
+
+  # Without an explicit list, screen every pair recorded in the data manifest
+  if not currency_pairs:
+    currency_pairs = list(load_manifest(base_path)['pairs'])
+  if listed_only:
+    currency_pairs = resolve_universe(currency_pairs)
+  latest_selected_files = resolve_latest_files(currency_pairs, base_path)
+
+  if rule is not None:
+    # Checked once here, so a typo fails before the pool starts
+    compile_rule(rule)
+  screen = screen_files(latest_selected_files, price_tolerance, volume_tolerance, num_consecutive_days, start_from, workers, rule)
+  shown = screen if show_all else screen[screen['signal'] != 'none']
+
+  if output_format == 'json':
+    text = json.dumps(shown.replace({np.nan: None}).to_dict(orient='records'), indent=1)
+  else:
+    text = shown.to_string(index=False, float_format=lambda value: f'{value:.4g}') if len(shown) else 'No active streaks'
+
+  if output:
+    with open(output, 'w') as output_file:
+      output_file.write(text + '\n')
+    print(f"\n This file is saved: {output}\n")
+  else:
+    print(text)
+
+  print(f"\n{(screen['signal'] == 'open').sum()} open, {(screen['signal'] == 'building').sum()} building, {len(screen)} pairs screened")
+  return screen
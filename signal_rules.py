@@ -0,0 +1,263 @@
+import ast
+import functools
+
+import numpy as np
+
+from streak_engine import StreakDetector
+
+
+
+
+
+
+# Columns a rule can refer to; price is max(open, close), the series the default strategy compares
+RULE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'price']
+
+# Scalars bound at evaluation time: the price and volume tolerances (-p, -v)
+RULE_PARAMETERS = ['p', 'v']
+
+# is_higher_close_and_volume as a rule; gives the same mask as build_pass_mask bit for bit
+DEFAULT_RULE = 'price >= price[-1] - price[-1] * p and volume >= volume[-1] - volume[-1] * v'
+
+
+def _shift(values, periods):
+  """
+  Value periods rows earlier along the time axis (axis 0); the first rows are NaN.
+  """
+  shifted = np.full(values.shape, np.nan)
+  if periods < len(values):
+    shifted[periods:] = values[:len(values) - periods]
+  return shifted
+
+
+def _window(values, periods, reduce):
+  """
+  Applies reduce over the trailing window of periods rows, current row included.
+
+  Every window is reduced on its own (no running sums), so a row gets the
+  same value whether the series is evaluated whole or chunk by chunk.
+  """
+  result = np.full(values.shape, np.nan)
+  if periods <= len(values):
+    windows = np.lib.stride_tricks.sliding_window_view(values, periods, axis=0)
+    result[periods - 1:] = reduce(windows, axis=-1)
+  return result
+
+
+def _sma(values, periods):
+  return _window(values, periods, np.mean)
+
+
+def _highest(values, periods):
+  return _window(values, periods, np.max)
+
+
+def _lowest(values, periods):
+  return _window(values, periods, np.min)
+
+
+# Rule functions: name -> (helper, takes a period argument)
+RULE_FUNCTIONS = {
+  'sma': (_sma, True),
+  'highest': (_highest, True),
+  'lowest': (_lowest, True),
+  'max': (np.fmax, False),
+  'min': (np.fmin, False),
+  'abs': (np.abs, False),
+}
+
+_BINARY_OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/'}
+_COMPARE_OPERATORS = {ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=', ast.Eq: '==', ast.NotEq: '!='}
+
+
+class _RuleCompiler:
+  """
+  Translates a rule's syntax tree into one NumPy expression.
+
+  Every node returns (source, lookback, is_condition): the generated code, the
+  number of earlier rows it reads, and whether it yields booleans.
+  """
+  def __init__(self, text):
+    self.text = text
+    self.columns = set()
+
+  def error(self, message):
+    return ValueError(f"Invalid rule '{self.text}': {message}")
+
+  def period(self, node):
+    if not (isinstance(node, ast.Constant) and type(node.value) is int and node.value >= 1):
+      raise self.error('window lengths must be positive integers')
+    return node.value
+
+  def visit(self, node):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+      return repr(float(node.value)), 0, False
+
+    if isinstance(node, ast.Name):
+      if node.id in RULE_PARAMETERS:
+        return node.id, 0, False
+      if node.id not in RULE_COLUMNS:
+        raise self.error(f"unknown name '{node.id}'; use {', '.join(RULE_COLUMNS + RULE_PARAMETERS)}")
+      self.columns.update(['open', 'close'] if node.id == 'price' else [node.id])
+      return node.id, 0, False
+
+    if isinstance(node, ast.Subscript):
+      # x[-k] is x k rows earlier; only the past can be looked at
+      index = node.slice
+      if isinstance(index, ast.UnaryOp) and isinstance(index.op, ast.USub) and isinstance(index.operand, ast.Constant):
+        periods = index.operand.value
+      elif isinstance(index, ast.Constant) and index.value == 0:
+        periods = 0
+      else:
+        raise self.error('lookbacks are written x[-k] with a constant k')
+      if type(periods) is not int:
+        raise self.error('lookbacks are written x[-k] with a constant k')
+      source, lookback, _ = self.value(node.value)
+      return (f'_shift({source}, {periods})' if periods else source), lookback + periods, False
+
+    if isinstance(node, ast.Call):
+      if not isinstance(node.func, ast.Name) or node.func.id not in RULE_FUNCTIONS or node.keywords:
+        raise self.error(f"unknown function; use {', '.join(RULE_FUNCTIONS)}")
+      helper, windowed = RULE_FUNCTIONS[node.func.id]
+      if windowed:
+        if len(node.args) != 2:
+          raise self.error(f'{node.func.id}(x, n) takes a series and a window length')
+        source, lookback, _ = self.value(node.args[0])
+        periods = self.period(node.args[1])
+        return f'_{node.func.id}({source}, {periods})', lookback + periods - 1, False
+      arguments = [self.value(argument) for argument in node.args]
+      if len(arguments) != (1 if node.func.id == 'abs' else 2):
+        raise self.error(f'wrong number of arguments for {node.func.id}()')
+      return f"_{node.func.id}({', '.join(source for source, _, _ in arguments)})", max(lookback for _, lookback, _ in arguments), False
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+      left, right = self.value(node.left), self.value(node.right)
+      return f'({left[0]} {_BINARY_OPERATORS[type(node.op)]} {right[0]})', max(left[1], right[1]), False
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+      source, lookback, _ = self.value(node.operand)
+      return f'(-{source})', lookback, False
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE_OPERATORS for op in node.ops):
+      # a < b < c is (a < b) and (b < c), like in Python
+      operands = [self.value(operand) for operand in [node.left] + node.comparators]
+      parts = [
+        f'({left[0]} {_COMPARE_OPERATORS[type(op)]} {right[0]})'
+        for left, op, right in zip(operands, node.ops, operands[1:])
+      ]
+      return self.combine('&', parts), max(lookback for _, lookback, _ in operands), True
+
+    if isinstance(node, ast.BoolOp):
+      operands = [self.condition(value) for value in node.values]
+      operator = '&' if isinstance(node.op, ast.And) else '|'
+      return self.combine(operator, [source for source, _, _ in operands]), max(lookback for _, lookback, _ in operands), True
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+      source, lookback, _ = self.condition(node.operand)
+      return f'(~{source})', lookback, True
+
+    raise self.error(f"unsupported syntax '{ast.unparse(node)}'")
+
+  def combine(self, operator, parts):
+    return parts[0] if len(parts) == 1 else '(' + f' {operator} '.join(parts) + ')'
+
+  def value(self, node):
+    compiled = self.visit(node)
+    if compiled[2]:
+      raise self.error(f"'{ast.unparse(node)}' is a condition, not a value")
+    return compiled
+
+  def condition(self, node):
+    compiled = self.visit(node)
+    if not compiled[2]:
+      raise self.error(f"'{ast.unparse(node)}' is a value, not a condition")
+    return compiled
+
+
+class SignalRule:
+  """
+  A pass condition over OHLCV columns, compiled once into a single NumPy expression.
+
+  evaluate() runs it over whole arrays: 1-D series of one pair or 2-D time x
+  pair matrices of a market panel, with lookbacks along the time axis. Rows
+  without enough history (NaN inputs) never pass. The resulting mask feeds
+  find_streak_bounds like the one from build_pass_mask.
+  """
+  def __init__(self, text):
+    compiler = _RuleCompiler(text)
+    try:
+      tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as error:
+      raise compiler.error(error.msg)
+
+    self.text = text
+    self.source, self.lookback, _ = compiler.condition(tree.body)
+    self.columns = sorted(compiler.columns)
+    if not self.columns:
+      raise compiler.error('a rule must use at least one column')
+    self._code = compile(self.source, f'<rule {text}>', 'eval')
+
+  def __repr__(self):
+    return f'SignalRule({self.text!r})'
+
+  def evaluate(self, columns, price_tolerance=0.0, volume_tolerance=0.0):
+    """
+    Returns the boolean pass mask for a dict of column arrays (e.g. read_ohlcv_arrays or MarketPanel.metrics).
+    """
+    namespace = {column: np.asarray(columns[column], dtype=np.float64) for column in self.columns}
+    if 'open' in namespace and 'close' in namespace:
+      namespace['price'] = np.fmax(namespace['open'], namespace['close'])
+    namespace.update({
+      'p': price_tolerance,
+      'v': volume_tolerance,
+      '_shift': _shift,
+      **{f'_{name}': helper for name, (helper, _) in RULE_FUNCTIONS.items()},
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+      mask = np.array(eval(self._code, {'__builtins__': {}}, namespace), dtype=bool)
+    # NaN comparisons already fail, except !=; rows before the lookback never pass
+    mask[:self.lookback] = False
+    return mask
+
+
+@functools.lru_cache(maxsize=64)
+def compile_rule(text):
+  """
+  Returns the compiled SignalRule of a rule text; each text is only compiled once per process.
+  """
+  return SignalRule(text)
+
+
+class RuleStreakDetector(StreakDetector):
+  """
+  StreakDetector driven by a SignalRule instead of the close and volume comparison.
+
+  Keeps the last rule.lookback rows between chunks, so lookbacks reach into the
+  previous chunk and feeding a history chunk by chunk gives the same positions
+  as evaluating the rule on the whole history.
+  """
+  def __init__(self, rule, price_tolerance, volume_tolerance, num_consecutive_days=3):
+    super().__init__(price_tolerance, volume_tolerance, num_consecutive_days)
+    self.rule = rule
+    self.columns = rule.columns
+    self.history = None
+
+  def feed_columns(self, columns):
+    values = {column: np.asarray(columns[column], dtype=np.float64) for column in self.columns}
+    num_rows = len(next(iter(values.values())))
+    base = self.rows
+    if not num_rows:
+      return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if self.history is None:
+      # The very first candle is never evaluated and does not reset the counter
+      mask = self.rule.evaluate(values, self.price_tolerance, self.volume_tolerance)[1:]
+      base += 1
+    else:
+      values = {column: np.concatenate((self.history[column], values[column])) for column in self.columns}
+      mask = self.rule.evaluate(values, self.price_tolerance, self.volume_tolerance)[-num_rows:]
+
+    keep = max(0, len(values[self.columns[0]]) - self.rule.lookback)
+    self.history = {column: values[column][keep:] for column in self.columns}
+    self.rows += num_rows
+    return self._feed_mask(mask, base)
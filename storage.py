@@ -0,0 +1,443 @@
+import datetime
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from defaults import DEFAULT_CHUNKSIZE, DEFAULT_FORMAT, FORMAT_EXTENSIONS
+
+
+
+
+
+
+# Column order written by download_historical_data
+OHLCV_COLUMNS = ['time', 'low', 'high', 'open', 'close', 'volume']
+PRICE_COLUMNS = ['low', 'high', 'open', 'close', 'volume']
+
+# Partition index kept in every .parts directory: period, generation and per-partition directory, rows and time bounds
+PARTITION_INDEX_NAME = 'index.json'
+
+FILENAME_TIME_FORMAT = '%Y-%m-%d-%H-%M'
+
+
+def storage_format(path):
+  """
+  Returns the storage format of a data file from its extension, or None if it is not a data file.
+  """
+  for fmt, extension in FORMAT_EXTENSIONS.items():
+    if path.rstrip('/').endswith(extension):
+      return fmt
+  return None
+
+
+def ohlcv_filename(currency_pair, interval, last_time, fmt=DEFAULT_FORMAT):
+  """
+  Builds the '{pair}_{interval}_{last_time}' file name used throughout data/{interval}/.
+  """
+  if not isinstance(last_time, str):
+    last_time = last_time.strftime(FILENAME_TIME_FORMAT)
+  return f"{currency_pair}_{interval}_{last_time}{FORMAT_EXTENSIONS[fmt]}"
+
+
+def parse_ohlcv_filename(filename):
+  """
+  Splits a data file name into (currency_pair, interval, last_time, fmt).
+
+  Returns None for names that do not follow the '{pair}_{interval}_{last_time}.{ext}' layout.
+  """
+  filename = os.path.basename(filename.rstrip('/'))
+  fmt = storage_format(filename)
+  if fmt is None:
+    return None
+
+  stem = filename[:-len(FORMAT_EXTENSIONS[fmt])]
+  parts = stem.split('_')
+  if len(parts) < 3:
+    return None
+
+  try:
+    last_time = datetime.datetime.strptime(parts[-1], FILENAME_TIME_FORMAT)
+    interval = int(parts[-2])
+  except ValueError:
+    return None
+
+  return ('_'.join(parts[:-2]), interval, last_time, fmt)
+
+
+def list_data_files(base_path):
+  """
+  Lists the data files and column directories in base_path with their parsed names.
+  """
+  entries = []
+  for name in os.listdir(base_path):
+    parsed = parse_ohlcv_filename(name)
+    if parsed is not None:
+      entries.append((os.path.join(base_path, name), parsed))
+  return entries
+
+
+def to_epoch_seconds(times):
+  """
+  Converts datetimes (Series, Index or array) to int64 epoch seconds.
+  """
+  return np.asarray(pd.to_datetime(times).values.astype('datetime64[s]').astype(np.int64))
+
+
+def format_epoch(seconds, fmt=FILENAME_TIME_FORMAT):
+  """
+  Formats int64 epoch seconds as a UTC time string, by default in the file name format.
+  """
+  return datetime.datetime.fromtimestamp(int(seconds), tz=datetime.timezone.utc).strftime(fmt)
+
+
+def read_ohlcv_arrays(path, columns=None, mmap=True):
+  """
+  Reads a data file into a dict of NumPy arrays; 'time' is int64 epoch seconds.
+
+  Column directories are memory-mapped, so only the pages that are touched are read.
+  """
+  columns = list(columns or OHLCV_COLUMNS)
+  fmt = storage_format(path)
+
+  if fmt == 'npcol':
+    return _load_columns(path, columns, mmap)
+
+  if fmt == 'parts':
+    partitions = [_load_columns(partition_dir(path, partition), columns, mmap) for partition in read_partition_index(path)['partitions']]
+    return {
+      column: np.concatenate([arrays[column] for arrays in partitions]) if partitions else np.empty(0, dtype=np.int64 if column == 'time' else np.float64)
+      for column in columns
+    }
+
+  if fmt == 'csv':
+    dtypes = {column: np.float64 for column in columns if column != 'time'}
+    data = pd.read_csv(path, usecols=columns, dtype=dtypes, float_precision='round_trip')
+    arrays = {column: data[column].to_numpy() for column in columns if column != 'time'}
+    if 'time' in columns:
+      arrays['time'] = to_epoch_seconds(data['time'])
+    return arrays
+
+  raise ValueError(f"Unsupported data file: {path}")
+
+
+def iter_ohlcv_chunks(path, columns=None, chunksize=DEFAULT_CHUNKSIZE, start=None, end=None, start_row=0, stop_row=None):
+  """
+  Reads a data file chunk by chunk and yields (first_row, arrays) tuples.
+
+  Only the requested columns are parsed, with 'time' as int64 epoch seconds and
+  prices as float64, so peak memory is bounded by chunksize rather than history length.
+  first_row is the position of the chunk's first row in the whole file.
+
+  Args:
+      start, end (int): optional epoch-second bounds, inclusive; reading stops once a row passes end.
+      start_row, stop_row (int): optional row bounds, stop_row exclusive.
+  """
+  columns = list(columns or OHLCV_COLUMNS)
+  by_time = start is not None or end is not None
+  read_columns = columns if 'time' in columns or not by_time else ['time', *columns]
+  fmt = storage_format(path)
+
+  if fmt == 'npcol':
+    yield from _iter_column_chunks(_load_columns(path, read_columns), columns, chunksize, start, end, start_row, stop_row)
+    return
+
+  if fmt == 'parts':
+    partitions = read_partition_index(path)['partitions']
+    offsets = np.cumsum([0] + [partition['rows'] for partition in partitions])
+    # Partitions are sorted by time, so only the ones overlapping [start, end] are opened
+    first = 0 if start is None else int(np.searchsorted([partition['last_time'] for partition in partitions], start, side='left'))
+    last = len(partitions) if end is None else int(np.searchsorted([partition['first_time'] for partition in partitions], end, side='right'))
+    for i in range(first, last):
+      offset = int(offsets[i])
+      if stop_row is not None and offset >= stop_row:
+        break
+      if offsets[i + 1] <= start_row:
+        continue
+      arrays = _load_columns(partition_dir(path, partitions[i]), read_columns)
+      partition_stop = None if stop_row is None else stop_row - offset
+      for first_row, chunk in _iter_column_chunks(arrays, columns, chunksize, start, end, max(0, start_row - offset), partition_stop):
+        yield offset + first_row, chunk
+    return
+
+  if fmt != 'csv':
+    raise ValueError(f"Unsupported data file: {path}")
+
+  dtypes = {column: np.float64 for column in read_columns if column != 'time'}
+  reader = pd.read_csv(
+    path,
+    usecols=read_columns,
+    dtype=dtypes,
+    float_precision='round_trip',
+    chunksize=chunksize,
+    skiprows=range(1, start_row + 1) if start_row else None,
+  )
+
+  row = start_row
+  with reader:
+    for data in reader:
+      first_row, row = row, row + len(data)
+      if stop_row is not None and first_row >= stop_row:
+        break
+
+      arrays = {column: data[column].to_numpy() for column in read_columns if column != 'time'}
+      if 'time' in read_columns:
+        arrays['time'] = to_epoch_seconds(data['time'])
+
+      first, last = 0, len(data)
+      if stop_row is not None:
+        last = min(last, stop_row - first_row)
+      if start is not None:
+        first = int(np.searchsorted(arrays['time'][:last], start, side='left'))
+      passed_end = False
+      if end is not None:
+        in_range = int(np.searchsorted(arrays['time'][:last], end, side='right'))
+        passed_end = in_range < last
+        last = in_range
+
+      if first < last:
+        yield first_row + first, {column: arrays[column][first:last] for column in columns}
+      if passed_end or (stop_row is not None and row >= stop_row):
+        break
+
+
+def _load_columns(path, columns, mmap=True):
+  mmap_mode = 'r' if mmap else None
+  return {column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode=mmap_mode) for column in columns}
+
+
+def _iter_column_chunks(arrays, columns, chunksize, start=None, end=None, start_row=0, stop_row=None):
+  num_rows = len(next(iter(arrays.values())))
+  first = start_row
+  last = num_rows if stop_row is None else min(stop_row, num_rows)
+  # Column files are sorted by time, so time bounds are a binary search on the memory map
+  if start is not None:
+    first = max(first, int(np.searchsorted(arrays['time'], start, side='left')))
+  if end is not None:
+    last = min(last, int(np.searchsorted(arrays['time'], end, side='right')))
+  for chunk_start in range(first, last, chunksize):
+    chunk_end = min(chunk_start + chunksize, last)
+    yield chunk_start, {column: arrays[column][chunk_start:chunk_end] for column in columns}
+
+
+def read_partition_index(path):
+  with open(os.path.join(path, PARTITION_INDEX_NAME)) as index_file:
+    return json.load(index_file)
+
+
+def partition_dir(path, partition):
+  """
+  Returns the column directory of one index entry; indexes written before appends were versioned have no 'dir'.
+  """
+  return os.path.join(path, partition.get('dir', partition['name']))
+
+
+def partition_period(interval):
+  """
+  Daily and coarser candles are partitioned by year, finer ones by month.
+  """
+  return 'year' if interval >= 86400 else 'month'
+
+
+def partition_keys(times, period):
+  """
+  Returns the partition name ('2024' or '2024-01') of every epoch time.
+  """
+  unit = 'Y' if period == 'year' else 'M'
+  return np.asarray(times, dtype=np.int64).astype('datetime64[s]').astype(f'datetime64[{unit}]').astype(str)
+
+
+def write_marker_path(path):
+  """
+  Returns the file of a data file that is rewritten on every write, to tell its versions apart by size and mtime.
+  """
+  fmt = storage_format(path)
+  if fmt == 'npcol':
+    return os.path.join(path, 'meta.json')
+  if fmt == 'parts':
+    return os.path.join(path, PARTITION_INDEX_NAME)
+  return path
+
+
+def read_ohlcv(path, columns=None):
+  """
+  Reads a data file into a DataFrame with a datetime64 'time' column, whatever its storage format.
+  """
+  columns = list(columns or OHLCV_COLUMNS)
+  arrays = read_ohlcv_arrays(path, columns)
+  if 'time' in arrays:
+    arrays['time'] = pd.to_datetime(np.asarray(arrays['time']), unit='s')
+  return pd.DataFrame({column: arrays[column] for column in columns})
+
+
+def _ohlcv_arrays(df):
+  times = to_epoch_seconds(df['time']) if len(df) else np.empty(0, dtype=np.int64)
+  return {'time': times, **{column: df[column].to_numpy(dtype=np.float64) for column in PRICE_COLUMNS}}
+
+
+def _write_columns(arrays, path):
+  # Write into a sibling temp directory and rename it into place
+  tmp_path = f'{path}.tmp'
+  shutil.rmtree(tmp_path, ignore_errors=True)
+  os.makedirs(tmp_path)
+
+  for column in OHLCV_COLUMNS:
+    np.save(os.path.join(tmp_path, f'{column}.npy'), arrays[column])
+
+  with open(os.path.join(tmp_path, 'meta.json'), 'w') as meta_file:
+    json.dump({'rows': int(len(arrays['time'])), 'columns': OHLCV_COLUMNS}, meta_file)
+
+  if os.path.exists(path):
+    shutil.rmtree(path)
+  os.rename(tmp_path, path)
+
+
+def _write_npcol(df, path):
+  _write_columns(_ohlcv_arrays(df), path)
+
+
+def _write_partitions(arrays, path, period, suffix=''):
+  """
+  Writes time-sorted arrays as one column directory per partition into path and returns their index entries.
+
+  Directories are named after their partition plus suffix, so a rewrite can sit
+  next to the partitions it replaces until the index is switched over.
+  """
+  keys = partition_keys(arrays['time'], period)
+  starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.empty(0, dtype=np.int64)
+  ends = np.append(starts[1:], len(keys))
+
+  partitions = []
+  for first, last in zip(starts, ends):
+    _write_columns({column: values[first:last] for column, values in arrays.items()}, os.path.join(path, f'{keys[first]}{suffix}'))
+    partitions.append({
+      'name': str(keys[first]),
+      'dir': f'{keys[first]}{suffix}',
+      'rows': int(last - first),
+      'first_time': int(arrays['time'][first]),
+      'last_time': int(arrays['time'][last - 1]),
+    })
+  return partitions
+
+
+def _save_partition_index(path, index):
+  index['rows'] = sum(partition['rows'] for partition in index['partitions'])
+  tmp_path = os.path.join(path, f'{PARTITION_INDEX_NAME}.tmp')
+  with open(tmp_path, 'w') as index_file:
+    json.dump(index, index_file, indent=1)
+  os.replace(tmp_path, os.path.join(path, PARTITION_INDEX_NAME))
+
+
+def _write_parts(df, path):
+  period = partition_period(parse_ohlcv_filename(path)[1])
+
+  # Like column directories, the whole tree is built next to the target and renamed into place
+  tmp_path = f'{path}.tmp'
+  shutil.rmtree(tmp_path, ignore_errors=True)
+  os.makedirs(tmp_path)
+  partitions = _write_partitions(_ohlcv_arrays(df), tmp_path, period)
+  _save_partition_index(tmp_path, {'period': period, 'generation': 0, 'columns': OHLCV_COLUMNS, 'partitions': partitions})
+
+  if os.path.exists(path):
+    shutil.rmtree(path)
+  os.rename(tmp_path, path)
+
+
+def write_ohlcv(df, path):
+  """
+  Writes an OHLCV DataFrame with a 'time' column in the format given by the path's extension.
+  """
+  fmt = storage_format(path)
+
+  if fmt == 'npcol':
+    _write_npcol(df, path)
+  elif fmt == 'parts':
+    _write_parts(df, path)
+  elif fmt == 'csv':
+    tmp_path = f'{path}.tmp'
+    df[OHLCV_COLUMNS].to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+  else:
+    raise ValueError(f"Unsupported data file: {path}")
+
+
+def append_parts(path, df, target_path=None):
+  """
+  Merges new candles into a .parts directory, rewriting only the partitions they fall in.
+
+  Candles present in both keep the new values, like a full rewrite would. The
+  directory is then renamed to target_path (its name holds the last time).
+  Returns the index of the merged directory.
+
+  Rewritten partitions go to new directories of the next generation, next to
+  the live ones, and the index is switched to them in one rename; only then
+  are the replaced directories removed. A crash at any point leaves an index
+  that matches the partitions it points to, and whatever the crash left
+  behind is removed by the next append.
+  """
+  index = read_partition_index(path)
+  new = _ohlcv_arrays(df)
+  if len(new['time']):
+    # Only partitions from the one holding the oldest new candle on are read and rewritten; normally just the newest
+    first_key = partition_keys(new['time'][:1], index['period'])[0]
+    kept = [partition for partition in index['partitions'] if partition['name'] < first_key]
+    touched = [partition for partition in index['partitions'] if partition['name'] >= first_key]
+
+    old = [_load_columns(partition_dir(path, partition), OHLCV_COLUMNS, mmap=False) for partition in touched]
+    merged = {column: np.concatenate([arrays[column] for arrays in old] + [new[column]]) for column in OHLCV_COLUMNS}
+    # Stable sort with the new candles last, then keep the last candle of every time
+    order = np.argsort(merged['time'], kind='stable')
+    merged = {column: values[order] for column, values in merged.items()}
+    last_of_time = np.append(merged['time'][1:] != merged['time'][:-1], True)
+    merged = {column: values[last_of_time] for column, values in merged.items()}
+
+    # The merged candles still cover every touched partition, so all of them are replaced
+    index['generation'] = index.get('generation', 0) + 1
+    index['partitions'] = kept + _write_partitions(merged, path, index['period'], suffix=f".g{index['generation']}")
+    _save_partition_index(path, index)
+
+    live = {os.path.basename(partition_dir(path, partition)) for partition in index['partitions']}
+    for entry in os.scandir(path):
+      if entry.is_dir() and entry.name not in live:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+  if target_path and os.path.abspath(target_path) != os.path.abspath(path):
+    if os.path.exists(target_path):
+      shutil.rmtree(target_path)
+    os.rename(path, target_path)
+  return index
+
+
+def remove_ohlcv(path):
+  """
+  Removes a data file or column directory.
+  """
+  if os.path.isdir(path):
+    shutil.rmtree(path)
+  elif os.path.exists(path):
+    os.remove(path)
+
+
+def migrate_directory(base_path, fmt, keep=False):
+  """
+  Converts every data file in base_path to the given format.
+
+  Also used to export column directories back to CSV. The source files are
+  removed once the converted file is written unless keep is set.
+  """
+  converted = []
+  for path, (currency_pair, interval, last_time, source_fmt) in sorted(list_data_files(base_path)):
+    if source_fmt == fmt:
+      continue
+
+    target = os.path.join(base_path, ohlcv_filename(currency_pair, interval, last_time, fmt))
+    write_ohlcv(read_ohlcv(path), target)
+    if not keep:
+      remove_ohlcv(path)
+
+    print(f"Converted {path} -> {target}")
+    converted.append(target)
+
+  return converted
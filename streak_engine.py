@@ -0,0 +1,195 @@
+import numpy as np
+
+
+
+
+
+
+
+def build_price_series(open_prices, close_prices):
+  """
+  Returns max(open, close) per candle as float64, ignoring NaN like DataFrame.max(axis=1).
+  """
+  return np.fmax(
+    np.asarray(open_prices, dtype=np.float64),
+    np.asarray(close_prices, dtype=np.float64),
+  )
+
+
+def build_pass_mask(price, volume, price_tolerance, volume_tolerance):
+  """
+  Evaluates is_higher_close_and_volume for every row at once.
+
+  Args:
+      price (array): max(open, close) per candle.
+      volume (array): volume per candle.
+
+  Returns a boolean array of len(price); element 0 is always False because the
+  first candle has no previous candle to compare against.
+  """
+  price = np.asarray(price, dtype=np.float64)
+  volume = np.asarray(volume, dtype=np.float64)
+
+  mask = np.zeros(len(price), dtype=bool)
+  if len(price) < 2:
+    return mask
+
+  previous_price = price[:-1]
+  previous_volume = volume[:-1]
+
+  # Same arithmetic as the per-row version so results match bit for bit
+  is_price_higher_or_close = price[1:] >= previous_price - previous_price * price_tolerance
+  is_volume_higher_or_close = volume[1:] >= previous_volume - previous_volume * volume_tolerance
+
+  mask[1:] = is_price_higher_or_close & is_volume_higher_or_close
+  return mask
+
+
+def find_streak_bounds(mask, num_consecutive_days=3):
+  """
+  Finds the entry and exit row of every streak from a pass mask built by build_pass_mask.
+
+  Mirrors the loop in find_consecutive_days: the counter starts at 1, grows by one
+  on every passing row and drops to 0 on a failing row. A position opens on the
+  row where the counter reaches num_consecutive_days and closes on the next
+  failing row. A position still open at the end of the data is not returned.
+
+  Returns two int64 arrays (entries, exits).
+  """
+  mask = np.asarray(mask, dtype=bool)
+  n = len(mask)
+  if n < 2 or num_consecutive_days < 1:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+  # Run boundaries of passing rows over indices 1..n-1
+  padded = np.concatenate(([0], mask[1:].astype(np.int8), [0]))
+  edges = np.diff(padded)
+  run_starts = np.flatnonzero(edges == 1) + 1
+  run_ends = np.flatnonzero(edges == -1) + 1  # exclusive, i.e. the failing row
+
+  # A run starting at index 1 inherits the initial counter value of 1
+  offsets = np.where(run_starts == 1, num_consecutive_days - 1, num_consecutive_days)
+  entries = run_starts + offsets - 1
+
+  # The counter must actually reach the target inside the run (offset 0 is never checked)
+  # and the run must be broken by a failing row before the data ends
+  valid = (offsets >= 1) & (entries < run_ends) & (run_ends < n)
+
+  return entries[valid].astype(np.int64), run_ends[valid].astype(np.int64)
+
+
+def find_streak_positions(mask, num_consecutive_days=3):
+  """
+  Same as find_streak_bounds but returns the [start, end, counter] lists used by
+  calculate_profits and the plotting code.
+  """
+  entries, exits = find_streak_bounds(mask, num_consecutive_days)
+  return [[int(start), int(end), 0] for start, end in zip(entries, exits)]
+
+
+def find_consecutive_positions(open_prices, close_prices, volume, price_tolerance, volume_tolerance, num_consecutive_days=3):
+  """
+  Convenience wrapper that goes from raw OHLCV columns to [start, end, counter] positions.
+  """
+  price = build_price_series(open_prices, close_prices)
+  mask = build_pass_mask(price, volume, price_tolerance, volume_tolerance)
+  return find_streak_positions(mask, num_consecutive_days)
+
+
+class StreakDetector:
+  """
+  Streaming version of find_streak_bounds for data read in chunks.
+
+  Carries the previous candle, the consecutive counter and a still-open entry
+  across calls to feed(), so feeding a history chunk by chunk yields exactly
+  the positions find_streak_bounds finds on the whole history.
+  """
+  # Columns feed_columns() needs from every chunk
+  columns = ['open', 'close', 'volume']
+
+  def __init__(self, price_tolerance, volume_tolerance, num_consecutive_days=3):
+    self.price_tolerance = price_tolerance
+    self.volume_tolerance = volume_tolerance
+    self.num_consecutive_days = num_consecutive_days
+    self.previous_price = None
+    self.previous_volume = None
+    self.counter = 1
+    self.entry = None
+    self.rows = 0
+
+  def feed(self, open_prices, close_prices, volume):
+    """
+    Processes the next chunk of candles.
+
+    Returns (entries, exits) int64 arrays of the positions closed in this chunk,
+    as row positions counted from the first candle ever fed. A position opened
+    but not yet closed is kept in self.entry.
+    """
+    price = build_price_series(open_prices, close_prices)
+    volume = np.asarray(volume, dtype=np.float64)
+    base = self.rows
+    if not len(price):
+      return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if self.previous_price is None:
+      # The very first candle is never evaluated and does not reset the counter
+      mask = build_pass_mask(price, volume, self.price_tolerance, self.volume_tolerance)[1:]
+      base += 1
+    else:
+      mask = build_pass_mask(
+        np.concatenate(([self.previous_price], price)),
+        np.concatenate(([self.previous_volume], volume)),
+        self.price_tolerance,
+        self.volume_tolerance,
+      )[1:]
+
+    self.previous_price = price[-1]
+    self.previous_volume = volume[-1]
+    self.rows += len(price)
+
+    return self._feed_mask(mask, base)
+
+  def feed_columns(self, columns):
+    """
+    feed() taking a dict of column arrays, e.g. a chunk from iter_ohlcv_chunks.
+    """
+    return self.feed(columns['open'], columns['close'], columns['volume'])
+
+  def _feed_mask(self, mask, base):
+    n = len(mask)
+    no_positions = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    if n == 0 or self.num_consecutive_days < 1:
+      return no_positions
+
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.diff(padded)
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)  # exclusive, i.e. the failing row or n
+
+    # Only a run touching the chunk start continues the carried counter
+    initial = np.where(run_starts == 0, self.counter, 0)
+    offsets = self.num_consecutive_days - initial
+    run_entries = run_starts + offsets - 1
+    opened = (offsets >= 1) & (run_entries < run_ends)
+
+    closed = opened & (run_ends < n)
+    entries = [run_entries[closed] + base]
+    exits = [run_ends[closed] + base]
+
+    # A position carried over from the previous chunk closes on the first failing row
+    if self.entry is not None:
+      failing = np.flatnonzero(~mask)
+      if len(failing):
+        entries.insert(0, [self.entry])
+        exits.insert(0, [failing[0] + base])
+        self.entry = None
+
+    # The last run may still be open at the end of the chunk
+    if len(run_starts) and run_ends[-1] == n:
+      if opened[-1]:
+        self.entry = int(run_entries[-1] + base)
+      self.counter = int(initial[-1] + n - run_starts[-1])
+    else:
+      self.counter = 0
+
+    return np.concatenate(entries).astype(np.int64), np.concatenate(exits).astype(np.int64)
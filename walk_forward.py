@@ -0,0 +1,192 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from consecutivedays_analyzer import get_latest_currency_pairs
+from data_manifest import load_manifest
+from profit_stats import compute_profit_stats, years_of_rows
+from storage import parse_ohlcv_filename, read_ohlcv_arrays
+from streak_engine import build_pass_mask, build_price_series, find_streak_bounds
+
+
+
+
+
+
+
+FOLD_COLUMNS = [
+  'currency_pair', 'fold', 'train_start', 'train_end', 'test_start', 'test_end',
+  'price_tolerance', 'volume_tolerance', 'num_consecutive_days',
+  'train_cagr', 'test_cagr', 'test_total_return', 'test_trades',
+]
+
+
+class PairFeatures:
+  """
+  Arrays derived once per pair and shared by every window and parameter candidate.
+
+  Pass masks are cached per (price_tolerance, volume_tolerance) over the whole
+  history; every window takes a slice of the cached mask, since each row of a
+  window is compared with the previous row of the same window.
+  """
+  def __init__(self, arrays, interval=86400):
+    self.interval = interval
+    self.time = np.asarray(arrays['time'])
+    self.close = np.asarray(arrays['close'], dtype=np.float64)
+    self.volume = np.asarray(arrays['volume'], dtype=np.float64)
+    self.price = build_price_series(arrays['open'], arrays['close'])
+    self.masks = {}
+
+  def __len__(self):
+    return len(self.close)
+
+  def pass_mask(self, price_tolerance, volume_tolerance):
+    key = (price_tolerance, volume_tolerance)
+    if key not in self.masks:
+      self.masks[key] = build_pass_mask(self.price, self.volume, price_tolerance, volume_tolerance)
+    return self.masks[key]
+
+  def window_stats(self, start, end, price_tolerance, volume_tolerance, num_consecutive_days):
+    """
+    Profit statistics of rows [start, end), as analyze would report with the same start_from/remove_lastdatapoints.
+    """
+    # find_streak_bounds never looks at the window's first row, so the cached mask is sliced without a copy
+    mask = self.pass_mask(price_tolerance, volume_tolerance)[start:end]
+    entries, exits = find_streak_bounds(mask, num_consecutive_days)
+    positions = np.column_stack((entries, exits, np.zeros_like(entries)))
+    return compute_profit_stats(self.close[start:end], positions, end - start, interval=self.interval)
+
+
+def walk_forward_windows(num_rows, train_size, test_size, anchored=False):
+  """
+  Returns (train_start, train_end, test_start, test_end) row bounds of every fold.
+
+  Folds step forward by test_size; with anchored the train window always starts at row 0.
+  """
+  if train_size < 2 or test_size < 2:
+    raise ValueError("Train and test windows need at least 2 rows each")
+
+  windows = []
+  test_start = train_size
+  while test_start + test_size <= num_rows:
+    train_start = 0 if anchored else test_start - train_size
+    windows.append((train_start, test_start, test_start, test_start + test_size))
+    test_start += test_size
+  return windows
+
+
+def walk_forward_pair(features, candidates, train_size, test_size, anchored=False):
+  """
+  Picks the best candidate on every train window by CAGR and evaluates it on the following test window.
+  """
+  folds = []
+  for fold, (train_start, train_end, test_start, test_end) in enumerate(walk_forward_windows(len(features), train_size, test_size, anchored)):
+    best, best_key = None, None
+    for candidate in candidates:
+      stats = features.window_stats(train_start, train_end, *candidate)
+      # Rank like the sweep: CAGR first, then total return; NaN never wins
+      key = (np.nan_to_num(stats['cagr'], nan=-np.inf), np.nan_to_num(stats['total_return'], nan=-np.inf))
+      if best_key is None or key > best_key:
+        best, best_key = (candidate, stats), key
+
+    candidate, train_stats = best
+    test_stats = features.window_stats(test_start, test_end, *candidate)
+    folds.append({
+      'fold': fold,
+      'train_start': train_start,
+      'train_end': train_end,
+      'test_start': test_start,
+      'test_end': test_end,
+      'price_tolerance': candidate[0],
+      'volume_tolerance': candidate[1],
+      'num_consecutive_days': candidate[2],
+      'train_cagr': train_stats['cagr'],
+      'test_cagr': test_stats['cagr'],
+      'test_total_return': test_stats['total_return'],
+      'test_trades': test_stats['trades'],
+    })
+  return folds
+
+
+def summarize_folds(folds, investment_amount=100, interval=86400):
+  """
+  Compounds the out-of-sample test windows into one balance and CAGR; interval is the candle interval in seconds.
+  """
+  balance = investment_amount
+  test_rows = 0
+  for fold in folds:
+    balance *= 1 + fold['test_total_return'] / investment_amount
+    test_rows += fold['test_end'] - fold['test_start']
+
+  years = years_of_rows(test_rows, interval)
+  return {
+    'folds': len(folds),
+    'balance': balance,
+    'total_return': balance - investment_amount,
+    'cagr': ((balance / investment_amount) ** (1 / years) - 1) * 100,
+    'years': years,
+  }
+
+
+def walk_forward(
+    currency_pairs,
+    price_tolerances,
+    volume_tolerances,
+    num_consecutive_days_grid,
+    train_size,
+    test_size,
+    interval = 86400,
+    start_from = 0,
+    remove_lastdatapoints = 0,
+    anchored = False,
+    output = None,
+):
+  script_directory = os.path.dirname(os.path.abspath(__file__))
+
+  # Without an explicit list, walk forward over every pair in the data directory
+  if not currency_pairs:
+    currency_pairs = list(load_manifest(f'{script_directory}/data/{interval}/')['pairs'])
+
+  latest_selected_files = get_latest_currency_pairs(currency_pairs, interval, script_directory)
+  candidates = list(itertools.product(price_tolerances, volume_tolerances, num_consecutive_days_grid))
+  print(f"Walking forward with {len(candidates)} parameter combinations, train={train_size} rows, test={test_size} rows{' (anchored)' if anchored else ''}")
+
+  all_folds = []
+  for selected_file in latest_selected_files:
+    currency_pair = parse_ohlcv_filename(selected_file)[0]
+
+    # One read and one set of derived arrays per pair, sliced like analyze
+    arrays = read_ohlcv_arrays(selected_file, columns=['time', 'open', 'close', 'volume'])
+    num_rows = len(arrays['time'])
+    arrays = {column: np.asarray(values[start_from:num_rows-remove_lastdatapoints]) for column, values in arrays.items()}
+    features = PairFeatures(arrays, interval)
+
+    folds = walk_forward_pair(features, candidates, train_size, test_size, anchored)
+    if not folds:
+      print(f"\n{currency_pair}: {len(features)} rows are not enough for one train/test fold")
+      continue
+
+    summary = summarize_folds(folds, interval=interval)
+    for fold in folds:
+      fold['currency_pair'] = currency_pair
+      for bound in ['train_start', 'train_end', 'test_start', 'test_end']:
+        # End bounds are exclusive; report the last row's time
+        row = fold[bound] - 1 if bound.endswith('end') else fold[bound]
+        fold[bound] = pd.to_datetime(features.time[row], unit='s')
+
+    table = pd.DataFrame(folds, columns=FOLD_COLUMNS)
+    print(f"\nWalk-forward for {selected_file} ({len(features)} rows):")
+    print(table.drop(columns='currency_pair').to_string(index=False, float_format=lambda value: f'{value:.4g}'))
+    print(f"Out-of-sample: {summary['folds']} folds, total return {summary['total_return']:.2f}%, CAGR {summary['cagr']:.2f}% over {summary['years']:.2f} years")
+    all_folds.append(table)
+
+  if not all_folds:
+    return pd.DataFrame(columns=FOLD_COLUMNS)
+
+  all_folds = pd.concat(all_folds, ignore_index=True)
+  if output:
+    all_folds.to_csv(output, index=False)
+    print(f"\n This file is saved: {output}\n")
+  return all_folds